@@ -11,7 +11,7 @@ curves to show the sensitivity of the results to different assumed fixed stellar
 per galaxy (original, 25% reduction, 50% reduction, and 25% increase).
 
 Inputs:
-- Four CSV files generated by 'threshold_analysis_for_sensitivity.py', expected to be in
+- Four CSV (or Parquet) files generated by 'threshold_analysis_for_sensitivity.py', expected to be in
   a 'data/results/' directory relative to where this script is run:
     - 'data/results/stellar_mass_thresholds_results_original.csv'
     - 'data/results/stellar_mass_thresholds_results_25_percent_reduction.csv'
@@ -76,18 +76,20 @@ def plot_threshold_analysis_results(data_configs, output_image_path):
             print("Please ensure the file is correctly located in the 'data/results/' directory.")
             continue
 
+        # Load only the required columns (Parquet files are read column by column)
+        required_cols = ['f_star', 'lenses_below_threshold', 'percent_below_threshold']
         try:
-            df_results = pd.read_csv(csv_path)
+            if csv_path.endswith('.parquet'):
+                df_results = pd.read_parquet(csv_path, columns=required_cols)
+            else:
+                df_results = pd.read_csv(csv_path, usecols=required_cols)
+        except ValueError:
+            print(f"Error: Required columns {required_cols} not found in '{csv_path}'. Skipping this dataset.")
+            continue
         except Exception as e:
             print(f"Error loading data from '{csv_path}': {e}. Skipping this dataset.")
             continue
 
-        # Ensure required columns are present
-        required_cols = ['f_star', 'lenses_below_threshold', 'percent_below_threshold']
-        if not all(col in df_results.columns for col in required_cols):
-            print(f"Error: Required columns {required_cols} not found in '{csv_path}'. Skipping this dataset.")
-            continue
-
         # Calculate Poisson errors for the percentage
         df_results['error_percent'] = (np.sqrt(df_results['lenses_below_threshold']) / total_lenses) * 100
 
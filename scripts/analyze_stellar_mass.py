@@ -4,18 +4,22 @@
 #
 # This script performs a comparative statistical analysis of stellar mass surface
 # density distributions between a sample of strong gravitational lens galaxies
-# and a control sample of random sky galaxies. It utilizes synthetic data
-# generated based on provided summary statistics for demonstration.
+# and a control sample of random sky galaxies. By default it reads the lens and
+# random-field results tables (Parquet or CSV); synthetic data generated from the
+# published summary statistics is available as a fixture (DATA_SOURCE = 'synthetic').
 #
 # Key Features:
-# - Estimates log-normal distribution parameters from mean and standard deviation.
-# - Generates synthetic stellar mass surface density data for both lens and random samples.
+# - Loads lens surface densities and random-field galaxy counts from the results
+#   tables (see sample_loader.py), with explicit handling of zero-galaxy fields.
 # - Conducts non-parametric statistical tests:
 #   - Kolmogorov-Smirnov (K-S) test to compare distribution shapes.
 #   - Mann-Whitney U test (Wilcoxon Rank-Sum Test) to compare medians.
+# - Resampling (see resampling.py): bootstrap confidence intervals on the lens/random
+#   ratios of the mean and median, and permutation p-values for those ratios.
 # - Generates visual representations of the distributions:
 #   - Overlaid histograms (with logarithmic x-axis).
-#   - Kernel Density Estimates (KDEs) on a logarithmic scale.
+#   - Kernel Density Estimates (KDEs) on a logarithmic scale (binned FFT KDE with
+#     scipy's bandwidth, see binned_kde.py).
 #   - Box plots for quick visual comparison of central tendency and spread.
 #
 # The results of this analysis aim to determine if there are statistically
@@ -29,92 +33,66 @@
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy import stats
-from scipy.stats import lognorm # Stellar mass distributions are often log-normal
 import os # Import os for path operations
 
-# --- 1. Define the Known Summary Statistics (from your provided data) ---
-# These statistics are used to generate synthetic data for demonstration purposes.
-# In a real analysis, you would load your actual data from files.
-
-# Lens Sample Stellar Mass Surface Density (Sigma_star in Msun/kpc^2)
-# Mean: 9.97e6
-# Median: 4.79e6
-# Std Dev: 3.26e7
-# Count: 912
-
-# Random Sky Sample Stellar Mass Surface Density (Sigma_star in Msun/kpc^2)
-# Mean: 1.03e6 (derived from 86.07 mean galaxy count)
-# Median: 8.60e5 (derived from 86.07 mean galaxy count, assuming similar distribution)
-# Std Dev: 9.76e4 (derived from 9.76 std dev of galaxy count, assuming similar distribution)
-# Note: The median for randoms was 1.00e4 in a previous summary you provided,
-# but the 8.60e5 is derived consistently with the 1.03e6 mean from the 86.07 galaxy count.
-# We will use the 1.03e6 mean and 8.60e5 median for consistency with the derived mean.
-# If you have an exact median value for the 1.03e6 mean, please provide it.
-
-# For generating synthetic data, we need to estimate parameters for a log-normal distribution.
-# A log-normal distribution is often a good fit for astronomical quantities like mass.
-# Parameters for log-normal distribution: s (shape), loc (location/shift), scale (scale)
-# Mean = exp(mu + sigma^2/2)
-# Median = exp(mu)
-# Variance = (exp(sigma^2) - 1) * exp(2*mu + sigma^2)
-
-# Function to estimate log-normal parameters from mean and std dev
-def estimate_lognorm_params(mean, std_dev):
-    """
-    Estimates the shape (s) and scale (scale) parameters for a log-normal distribution
-    given its arithmetic mean and standard deviation.
-    The location (loc) parameter is assumed to be 0.
-    """
-    # Handle cases where mean is non-positive or std_dev is negative, which would lead to errors
-    if mean <= 0 or std_dev < 0:
-        print(f"Warning: Invalid input for log-normal parameter estimation (mean={mean}, std_dev={std_dev}). "
-              "Returning default parameters.")
-        return 1.0, 0.0, 1.0 # Default values, or raise an error depending on desired strictness
-
-    # Calculate variance
-    variance = std_dev**2
-
-    # Estimate mu and sigma for the underlying normal distribution
-    # sigma_sq = ln(1 + (std_dev/mean)^2)
-    # mu = ln(mean) - sigma_sq/2
-    sigma_sq = np.log(1 + (variance / (mean**2)))
-    mu = np.log(mean) - sigma_sq / 2
-
-    s = np.sqrt(sigma_sq)  # Shape parameter for scipy.stats.lognorm
-    scale = np.exp(mu)     # Scale parameter for scipy.stats.lognorm (which is exp(mu))
-    return s, 0, scale # loc (shift) is typically 0 for the standard log-normal in scipy
-
-num_samples = 912 # Number of synthetic data points to generate for each sample
-
-# Estimate parameters for Lens data
-s_lens, loc_lens, scale_lens = estimate_lognorm_params(9.97e6, 3.26e7)
-# Generate synthetic lens data
-# Robustness check for log-normal parameters to prevent non-finite values or errors
-if not np.isfinite([s_lens, scale_lens]).all() or s_lens <= 0 or scale_lens <= 0:
-    print("Warning: Lens log-normal parameter estimation resulted in problematic values. Using fallback for data generation.")
-    # Fallback to a reasonable log-normal distribution if estimation fails
-    lens_data = np.random.lognormal(mean=np.log(9.97e6), sigma=1.0, size=num_samples)
+from binned_kde import BinnedKDE
+from resampling import compare_samples, format_summary
+from sample_loader import load_lens_sample, load_random_sample, synthetic_samples
+
+# --- 1. Data source ---
+# 'results' reads the tables below (paths relative to the repository root);
+# 'synthetic' draws log-normal samples matching the published summary statistics.
+DATA_SOURCE = 'results'
+LENS_RESULTS = 'results/1486combined_lens_stellar_mass_all_2025Jul.parquet'
+RANDOM_RESULTS = 'results/stellar_density_random_fields.parquet'
+
+# Fields with no galaxies in the aperture (574 of the 1486 lenses): 'drop' leaves
+# them out (the 912-lens sample), 'keep' keeps them as zero densities (the published
+# lens mean and median include them; the log-scale plots then skip them) and 'raise'
+# stops with an error.
+ZERO_GALAXY = 'drop'
+
+# Random-field galaxy counts are converted to Msun/kpc^2 with the density per galaxy
+# of the published comparison, or, if RANDOM_FIELD_REDSHIFT is set, from the
+# per-galaxy mass over the 20 arcmin aperture at that redshift.
+RANDOM_FIELD_REDSHIFT = None
+
+# Synthetic fixture: samples per group and seed
+num_samples = 912
+SYNTHETIC_SEED = 42
+
+# KDE plot: error bound of the binned KDE, relative to the peak height of one kernel
+KDE_TOL = 1e-4
+
+# --- Resampling settings ---
+# Replicates for the bootstrap confidence intervals and the permutation test; results
+# are reproducible for a given RESAMPLING_SEED. Replicates are processed in chunks sized
+# to stay within RESAMPLING_MEMORY_BYTES each. RESAMPLING_WORKERS > 1 runs replicate
+# chunks on a process pool (on platforms that spawn rather than fork worker processes,
+# keep it at 1, as this script has no __main__ guard).
+N_BOOTSTRAP = 20000
+N_PERMUTATIONS = 20000
+RESAMPLING_SEED = 42
+RESAMPLING_MEMORY_BYTES = 256 * 2**20
+RESAMPLING_WORKERS = 1
+
+if DATA_SOURCE == 'results':
+    lens_sample = load_lens_sample(LENS_RESULTS, zero_galaxy=ZERO_GALAXY)
+    random_sample = load_random_sample(RANDOM_RESULTS, zero_galaxy=ZERO_GALAXY, redshift=RANDOM_FIELD_REDSHIFT)
+    for label, path, sample in [('Lens', LENS_RESULTS, lens_sample), ('Random', RANDOM_RESULTS, random_sample)]:
+        print(f"{label} results {path}: {sample.n_rows} rows, {sample.n_zero} with no galaxies "
+              f"({'dropped' if ZERO_GALAXY == 'drop' else 'kept'}), {sample.n_invalid} without a surface density")
+elif DATA_SOURCE == 'synthetic':
+    lens_sample, random_sample = synthetic_samples(num_samples, seed=SYNTHETIC_SEED)
 else:
-    lens_data = lognorm.rvs(s=s_lens, loc=loc_lens, scale=scale_lens, size=num_samples)
-
-# Estimate parameters for Random data
-s_random, loc_random, scale_random = estimate_lognorm_params(1.03e6, 9.76e4)
-# Generate synthetic random data
-if not np.isfinite([s_random, scale_random]).all() or s_random <= 0 or scale_random <= 0:
-    print("Warning: Random log-normal parameter estimation resulted in problematic values. Using fallback for data generation.")
-    # Fallback to a reasonable log-normal distribution if estimation fails
-    random_data = np.random.lognormal(mean=np.log(1.03e6), sigma=0.5, size=num_samples)
-else:
-    random_data = lognorm.rvs(s=s_random, loc=loc_random, scale=scale_random, size=num_samples)
+    raise ValueError(f"Unknown DATA_SOURCE {DATA_SOURCE!r}; expected 'results' or 'synthetic'")
 
-# Ensure no zeros or negative values in generated data (important for log-scale plots)
-# Replace non-positive values with a very small positive number (machine epsilon)
-lens_data[lens_data <= 0] = np.finfo(float).eps
-random_data[random_data <= 0] = np.finfo(float).eps
+lens_data = lens_sample.values
+random_data = random_sample.values
 
-print("--- Synthetic Data Generated ---")
-print(f"Synthetic Lens Data (N={len(lens_data)}): Mean={np.mean(lens_data):.2e}, Median={np.median(lens_data):.2e}, Std Dev={np.std(lens_data):.2e}")
-print(f"Synthetic Random Data (N={len(random_data)}): Mean={np.mean(random_data):.2e}, Median={np.median(random_data):.2e}, Std Dev={np.std(random_data):.2e}")
+print(f"--- Data ({DATA_SOURCE}) ---")
+print(f"Lens Data (N={len(lens_data)}): Mean={np.mean(lens_data):.2e}, Median={np.median(lens_data):.2e}, Std Dev={np.std(lens_data):.2e}")
+print(f"Random Data (N={len(random_data)}): Mean={np.mean(random_data):.2e}, Median={np.median(random_data):.2e}, Std Dev={np.std(random_data):.2e}")
 
 print("\n--- 2. Non-Parametric Statistical Tests ---")
 
@@ -145,6 +123,15 @@ if mw_p_value < 0.05:
 else:
     print("  Conclusion: No significant difference found in the medians (p >= 0.05).")
 
+# --- Bootstrap and permutation resampling ---
+# Uncertainty on the effect size: how many times higher the lens mean and median are
+# than the random ones, with percentile confidence intervals and permutation p-values.
+resampling_summary = compare_samples(lens_data, random_data, n_bootstrap=N_BOOTSTRAP,
+                                     n_permutations=N_PERMUTATIONS, seed=RESAMPLING_SEED,
+                                     memory_bytes=RESAMPLING_MEMORY_BYTES, max_workers=RESAMPLING_WORKERS)
+print()
+print(format_summary(resampling_summary))
+
 print("\n--- 3. Visual Representations ---")
 
 # Ensure the 'figures' directory exists for saving plots
@@ -154,10 +141,13 @@ if not os.path.exists('figures'):
 # --- Overlaid Histograms ---
 plt.figure(figsize=(12, 7))
 # Create logarithmically spaced bins for the histogram due to the wide range of stellar mass densities
-bins = np.logspace(np.log10(min(lens_data.min(), random_data.min())),
-                   np.log10(max(lens_data.max(), random_data.max())), 50)
-plt.hist(lens_data, bins=bins, alpha=0.6, label='Lens Sample', color='salmon', edgecolor='black', density=True)
-plt.hist(random_data, bins=bins, alpha=0.6, label='Random Sky Sample', color='skyblue', edgecolor='black', density=True)
+# Log-scale plots use the positive values only (zero-galaxy fields kept with ZERO_GALAXY = 'keep' are skipped)
+lens_positive = lens_data[lens_data > 0]
+random_positive = random_data[random_data > 0]
+bins = np.logspace(np.log10(min(lens_positive.min(), random_positive.min())),
+                   np.log10(max(lens_positive.max(), random_positive.max())), 50)
+plt.hist(lens_positive, bins=bins, alpha=0.6, label='Lens Sample', color='salmon', edgecolor='black', density=True)
+plt.hist(random_positive, bins=bins, alpha=0.6, label='Random Sky Sample', color='skyblue', edgecolor='black', density=True)
 plt.xscale('log') # Set x-axis to logarithmic scale
 plt.xlabel("Stellar Mass Surface Density (M$_{\\odot}$/kpc$^2$)", fontsize=12) # Using LaTeX for Msun
 plt.ylabel("Normalized Frequency", fontsize=12)
@@ -173,17 +163,19 @@ plt.show()
 # --- Kernel Density Estimates (KDEs) ---
 plt.figure(figsize=(12, 7))
 # For highly skewed data like stellar mass, it's often better to perform KDE on log-transformed data
-log_lens_data = np.log10(lens_data)
-log_random_data = np.log10(random_data)
+log_lens_data = np.log10(lens_positive)
+log_random_data = np.log10(random_positive)
 
 # Define a common range for the KDE x-axis based on the min/max of log-transformed data
 x_min_kde = min(log_lens_data.min(), log_random_data.min())
 x_max_kde = max(log_lens_data.max(), log_random_data.max())
 x_vals_kde = np.linspace(x_min_kde, x_max_kde, 500)
 
-# Compute KDEs for both samples
-kde_lens = stats.gaussian_kde(log_lens_data)
-kde_random = stats.gaussian_kde(log_random_data)
+# Compute KDEs for both samples. BinnedKDE uses gaussian_kde's bandwidth (Scott's rule)
+# but bins the samples and convolves by FFT, so its cost barely grows with sample size;
+# it stays within KDE_TOL of the kernel peak height of the exact gaussian_kde curve.
+kde_lens = BinnedKDE(log_lens_data, tol=KDE_TOL)
+kde_random = BinnedKDE(log_random_data, tol=KDE_TOL)
 
 # Plot KDEs, converting x-axis back to linear scale for interpretation
 plt.plot(10**x_vals_kde, kde_lens(x_vals_kde), label='Lens Sample (KDE)', color='red', linewidth=2)
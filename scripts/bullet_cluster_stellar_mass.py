@@ -9,6 +9,7 @@ This script performs a focused stellar mass estimation near the Bullet Cluster
 
 The output includes counts, positions, object types, and WISE magnitudes,
 as well as a simple stellar mass estimate based on the number of galaxies found.
+Responses are cached on disk (see query_cache.py), so re-runs work offline.
 
 Requires:
 - astroquery
@@ -25,9 +26,14 @@ from astropy.coordinates import SkyCoord, Angle
 import astropy.units as u
 import pandas as pd
 
+from query_cache import ResponseCache, CachedService
+
 # Coordinates of the Bullet Cluster (J2000)
 BULLET_CLUSTER_COORD = SkyCoord(ra=104.656, dec=-55.679, unit='deg')
 
+# On-disk cache of SIMBAD/IRSA responses
+CACHE = ResponseCache('./query_cache', ttl_seconds=90 * 86400, max_bytes=1e9)
+
 def query_simbad_galaxies(center_coord, radius_arcmin=0.5):
     """
     Query SIMBAD database for galaxy-type objects within radius_arcmin of center_coord.
@@ -44,7 +50,8 @@ def query_simbad_galaxies(center_coord, radius_arcmin=0.5):
     custom_simbad.add_votable_fields('otype', 'ra', 'dec')
 
     radius_deg = radius_arcmin / 60.0
-    result = custom_simbad.query_region(center_coord, radius=Angle(radius_deg, u.deg))
+    simbad = CachedService(custom_simbad, 'SIMBAD+otype,ra,dec', CACHE)
+    result = simbad.query_region(center_coord, radius=Angle(radius_deg, u.deg))
     if result is None or len(result) == 0:
         print("No SIMBAD objects found.")
         return None
@@ -68,7 +75,7 @@ def query_wise_sources(center_coord, radius_arcmin=0.5):
     - pandas DataFrame of WISE sources or None if none found
     """
     search_radius = radius_arcmin * u.arcmin
-    result = Irsa.query_region(center_coord, catalog="allwise_p3as_psd", spatial='Cone', radius=search_radius)
+    result = CachedService(Irsa, 'IRSA', CACHE).query_region(center_coord, catalog="allwise_p3as_psd", spatial='Cone', radius=search_radius)
     if len(result) == 0:
         print("No WISE sources found.")
         return None
@@ -93,3 +100,5 @@ if __name__ == "__main__":
         print(wise_sources[display_cols].to_string(index=False))
     else:
         print("No WISE sources found in query.")
+
+    CACHE.report()
@@ -0,0 +1,369 @@
+"""
+chunk_ingest.py
+
+Concurrent, resumable ingest of SDSS galaxies in RA/Dec box chunks (e.g. the whole
+Stripe 82 footprint for the random-field control sample).
+
+The random-field script used to fetch 5-degree RA chunks one after another and
+silently drop any chunk whose query failed. ChunkIngest instead:
+
+- fetches chunks on a thread pool with at most max_workers requests in flight
+  (optionally rate-limited with sdss_fetch.TokenBucket);
+- retries failed queries with exponential backoff and jitter;
+- writes every completed chunk to its own ECSV file under root/chunks/ and records
+  its status in root/state.json, both via atomic renames;
+- on a re-run, skips chunks already on disk and fetches only the missing or failed
+  ones, so an interrupted ingest resumes where it stopped.
+
+Chunk boxes are half-open (ra_min <= ra < ra_max, dec_min <= dec < dec_max), so
+objects on a shared chunk edge are ingested exactly once.
+
+Instead of fixed RA steps, plan_adaptive_chunks() sizes chunks from the data: it
+issues cheap COUNT(*) queries (or counts a local density sample) for coarse cells
+and recursively halves every cell holding more than target_rows along its longer
+side, level by level and concurrently. Dense regions get small chunks that stay
+below the SkyServer row limit; sparse regions stay in a few large chunks.
+ChunkIngest.plan() saves the plan in state.json so resumed runs do not recount.
+A response that reaches max_rows may be truncated; such chunks are recorded as
+'truncated' rather than done and are reported, never silently kept.
+
+Usage:
+    from chunk_ingest import ChunkIngest, plan_chunks
+    ingest = ChunkIngest('./stripe82_chunks', z_min=0.2, z_max=0.6)
+    chunks = plan_chunks([(310, 360), (0, 60)], -1.25, 1.25, ra_step=5)
+    ingest.run(chunks)
+    galaxies = ingest.load(chunks)
+
+    cells = plan_chunks([(310, 360), (0, 60)], -1.25, 1.25, ra_step=None)
+    chunks = ingest.plan(cells, target_rows=100000)   # adaptive, from COUNT(*) queries
+
+    python scripts/chunk_ingest.py      # ingest from a failing fake service, then resume
+
+Requires: astropy, numpy (and astroquery for querying SDSS)
+"""
+
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.table import Table, vstack
+
+from sdss_fetch import SDSS_MAX_ROWS, TokenBucket, sdss_sql_query
+
+SDSS_GALAXY_TYPE = 3
+DEFAULT_TARGET_ROWS = 100000  # rows per adaptive chunk, well below SDSS_MAX_ROWS
+CHUNK_COLUMNS = {'objID': np.int64, 'ra': float, 'dec': float, 'z': float}
+
+Chunk = namedtuple('Chunk', ['ra_min', 'ra_max', 'dec_min', 'dec_max'])
+
+
+def plan_chunks(ra_ranges, dec_min, dec_max, ra_step=5):
+    """
+    Fixed-width RA chunks of ra_step degrees over each (ra_min, ra_max) range
+    (ra_step=None gives one chunk per range, e.g. as starting cells for
+    plan_adaptive_chunks).
+    """
+    chunks = []
+    for ra_min_total, ra_max_total in ra_ranges:
+        step = ra_step or (ra_max_total - ra_min_total)
+        for ra_start in np.arange(ra_min_total, ra_max_total, step):
+            chunks.append(Chunk(float(ra_start), float(min(ra_start + step, ra_max_total)),
+                                float(dec_min), float(dec_max)))
+    return chunks
+
+
+def chunk_key(chunk):
+    """Stable file-name-safe identifier of a chunk."""
+    return f"ra{chunk.ra_min:.6f}_{chunk.ra_max:.6f}_dec{chunk.dec_min:+.6f}_{chunk.dec_max:+.6f}"
+
+
+def box_query_sql(chunk, z_min, z_max, galaxy_type=SDSS_GALAXY_TYPE):
+    """SQL for the spectroscopic galaxies with z_min <= z <= z_max inside one chunk."""
+    return f"""
+    SELECT p.objID, p.ra, p.dec, s.z
+    FROM PhotoObj AS p
+    JOIN SpecObjAll AS s ON p.objID = s.bestObjID
+    WHERE p.ra >= {chunk.ra_min} AND p.ra < {chunk.ra_max}
+      AND p.dec >= {chunk.dec_min} AND p.dec < {chunk.dec_max}
+      AND s.z BETWEEN {z_min} AND {z_max}
+      AND p.type = {galaxy_type}
+    """
+
+
+def count_query_sql(chunk, z_min, z_max, galaxy_type=SDSS_GALAXY_TYPE):
+    """SQL counting the rows box_query_sql() would return for chunk."""
+    return box_query_sql(chunk, z_min, z_max, galaxy_type).replace(
+        'SELECT p.objID, p.ra, p.dec, s.z', 'SELECT COUNT(*) AS n', 1)
+
+
+def sql_count_func(sql_func=None, z_min=0.2, z_max=0.6, galaxy_type=SDSS_GALAXY_TYPE):
+    """count_func for plan_adaptive_chunks() that runs COUNT(*) queries through sql_func."""
+    sql_func = sql_func or sdss_sql_query
+
+    def count(chunk):
+        result = sql_func(count_query_sql(chunk, z_min, z_max, galaxy_type))
+        return 0 if result is None or len(result) == 0 else int(result['n'][0])
+    return count
+
+
+def density_count_func(ra, dec, scale=1.0):
+    """
+    count_func for plan_adaptive_chunks() from a local density sample: scale times
+    the number of positions (e.g. a sparse or older catalog) inside each chunk.
+    """
+    ra, dec = np.asarray(ra, dtype=float), np.asarray(dec, dtype=float)
+
+    def count(chunk):
+        inside = ((ra >= chunk.ra_min) & (ra < chunk.ra_max) &
+                  (dec >= chunk.dec_min) & (dec < chunk.dec_max))
+        return int(np.ceil(scale * np.count_nonzero(inside)))
+    return count
+
+
+def split_chunk(chunk):
+    """Halve a chunk across its longer side (RA extent measured on the sky)."""
+    ra_mid = 0.5 * (chunk.ra_min + chunk.ra_max)
+    dec_mid = 0.5 * (chunk.dec_min + chunk.dec_max)
+    ra_extent = (chunk.ra_max - chunk.ra_min) * np.cos(np.radians(dec_mid))
+    if ra_extent >= chunk.dec_max - chunk.dec_min:
+        return [chunk._replace(ra_max=ra_mid), chunk._replace(ra_min=ra_mid)]
+    return [chunk._replace(dec_max=dec_mid), chunk._replace(dec_min=dec_mid)]
+
+
+def plan_adaptive_chunks(cells, count_func, target_rows=DEFAULT_TARGET_ROWS, max_rows=SDSS_MAX_ROWS,
+                         min_size_deg=0.01, max_workers=4):
+    """
+    Split cells until each holds at most target_rows rows according to count_func.
+
+    Cells are counted level by level on a thread pool; cells over target_rows are
+    halved (split_chunk) unless already smaller than min_size_deg on both sides.
+    Returns a list of (chunk, count) in RA/Dec order. Empty cells are dropped;
+    cells still over max_rows at the minimum size are kept with a warning.
+    """
+    planned = []
+    frontier = list(cells)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while frontier:
+            counts = list(pool.map(count_func, frontier))
+            next_frontier = []
+            for chunk, n in zip(frontier, counts):
+                splittable = (chunk.ra_max - chunk.ra_min > min_size_deg or
+                              chunk.dec_max - chunk.dec_min > min_size_deg)
+                if n > target_rows and splittable:
+                    next_frontier.extend(split_chunk(chunk))
+                elif n > 0:
+                    if n >= max_rows:
+                        print(f"Warning: chunk RA {chunk.ra_min}-{chunk.ra_max}, Dec {chunk.dec_min}-"
+                              f"{chunk.dec_max} holds {n} rows at the minimum size and will be truncated.")
+                    planned.append((chunk, n))
+            frontier = next_frontier
+    return sorted(planned)
+
+
+def empty_chunk_table():
+    """Empty table with the chunk columns, stored for chunks without galaxies."""
+    return Table(names=list(CHUNK_COLUMNS), dtype=list(CHUNK_COLUMNS.values()))
+
+
+class ChunkIngest:
+    """
+    Resumable chunked ingest into root/ (state.json plus chunks/<key>.ecsv).
+
+    sql_func(sql) -> Table or None replaces SDSS.query_sql (e.g. with a
+    fake_sdss.FakeSDSS.query_sql or a query_cache.CachedService). Each chunk gets
+    1 + max_retries attempts; attempt k waits backoff_base * 2**k seconds (capped
+    at backoff_max, with random jitter down to half of that) before retrying.
+    """
+
+    def __init__(self, root, z_min=0.2, z_max=0.6, galaxy_type=SDSS_GALAXY_TYPE, sql_func=None,
+                 max_workers=4, max_retries=4, backoff_base=1.0, backoff_max=60.0,
+                 requests_per_second=None, max_rows=SDSS_MAX_ROWS, seed=None):
+        self.root = root
+        self.query = {'z_min': z_min, 'z_max': z_max, 'galaxy_type': galaxy_type}
+        self.sql_func = sql_func or sdss_sql_query
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.max_rows = max_rows
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = TokenBucket(requests_per_second) if requests_per_second else None
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.join(root, 'chunks'), exist_ok=True)
+        state_path = os.path.join(root, 'state.json')
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+            if state['query'] != self.query:
+                raise ValueError(f"{root} holds an ingest with query settings {state['query']}, "
+                                 f"not {self.query}; use a different root directory")
+            self.chunks = state['chunks']
+            self.saved_plan = state.get('plan')
+        else:
+            self.chunks = {}
+            self.saved_plan = None
+            self._save_state()
+
+    def _save_state(self):
+        tmp_path = os.path.join(self.root, 'state.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'query': self.query, 'chunks': self.chunks, 'plan': self.saved_plan},
+                      f, indent=1, sort_keys=True)
+        os.replace(tmp_path, os.path.join(self.root, 'state.json'))
+
+    def _chunk_path(self, chunk):
+        return os.path.join(self.root, 'chunks', chunk_key(chunk) + '.ecsv')
+
+    def _record(self, chunk, **entry):
+        with self._lock:
+            previous = self.chunks.get(chunk_key(chunk), {})
+            self.chunks[chunk_key(chunk)] = {'box': list(chunk),
+                                             'attempts': previous.get('attempts', 0) + entry.pop('attempts'),
+                                             **entry}
+            self._save_state()
+
+    def plan(self, cells, target_rows=DEFAULT_TARGET_ROWS, count_func=None, min_size_deg=0.01):
+        """
+        Adaptive chunks covering cells (see plan_adaptive_chunks), counted with
+        COUNT(*) queries through sql_func (with the same retries as data queries)
+        unless count_func is given. A plan saved for the same cells and target_rows
+        is reused without recounting.
+        """
+        request = {'cells': [list(c) for c in cells], 'target_rows': target_rows}
+        if self.saved_plan is not None and self.saved_plan['request'] == request:
+            return [Chunk(*box) for box in self.saved_plan['chunks']]
+        count_func = count_func or sql_count_func(lambda sql: self._query(sql)[0], **self.query)
+        planned = plan_adaptive_chunks(cells, count_func, target_rows, self.max_rows, min_size_deg,
+                                       self.max_workers)
+        print(f"Planned {len(planned)} chunks for {sum(n for _, n in planned)} rows "
+              f"(target {target_rows} rows per chunk)")
+        with self._lock:
+            self.saved_plan = {'request': request, 'chunks': [list(c) for c, _ in planned],
+                               'counts': [n for _, n in planned]}
+            self._save_state()
+        return [chunk for chunk, _ in planned]
+
+    def is_done(self, chunk):
+        """True if chunk has been ingested and its file is on disk."""
+        entry = self.chunks.get(chunk_key(chunk))
+        return entry is not None and entry['status'] == 'done' and os.path.exists(self._chunk_path(chunk))
+
+    def pending(self, chunks):
+        """The chunks still to be fetched (never attempted, failed, or missing on disk)."""
+        return [chunk for chunk in chunks if not self.is_done(chunk)]
+
+    def failed(self, chunks):
+        """The chunks whose last run exhausted their retries or hit the row limit."""
+        return [chunk for chunk in chunks
+                if self.chunks.get(chunk_key(chunk), {}).get('status') in ('failed', 'truncated')]
+
+    def _backoff(self, attempt):
+        with self._lock:
+            jitter = self._rng.uniform(0.5, 1.0)
+        return min(self.backoff_max, self.backoff_base * 2**attempt) * jitter
+
+    def _query(self, sql):
+        """Run sql with retries and backoff. Returns (result, attempts); re-raises the last error."""
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(self._backoff(attempt - 1))
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                return self.sql_func(sql), attempt + 1
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+
+    def _fetch(self, chunk):
+        """Fetch, persist and record one chunk. Returns True on success."""
+        try:
+            result, attempts = self._query(box_query_sql(chunk, **self.query))
+        except Exception as e:
+            print(f"Error querying RA {chunk.ra_min}-{chunk.ra_max}, Dec {chunk.dec_min}-{chunk.dec_max} "
+                  f"after {self.max_retries + 1} attempts: {e}")
+            self._record(chunk, status='failed', attempts=self.max_retries + 1, error=str(e))
+            return False
+
+        if result is not None and len(result) >= self.max_rows:
+            print(f"Warning: RA {chunk.ra_min}-{chunk.ra_max}, Dec {chunk.dec_min}-{chunk.dec_max} "
+                  f"returned {len(result)} rows and may be truncated; plan smaller chunks.")
+            self._record(chunk, status='truncated', attempts=attempts, n_rows=len(result))
+            return False
+
+        table = empty_chunk_table() if result is None or len(result) == 0 else Table(result)
+        tmp_path = self._chunk_path(chunk) + '.tmp'
+        table.write(tmp_path, format='ascii.ecsv', overwrite=True)
+        os.replace(tmp_path, self._chunk_path(chunk))
+        self._record(chunk, status='done', attempts=attempts, n_rows=len(table))
+        return True
+
+    def run(self, chunks):
+        """
+        Fetch every chunk not yet on disk. Returns (n_done, n_failed) for this run;
+        failed chunks are retried on the next run.
+        """
+        todo = self.pending(chunks)
+        print(f"Ingesting {len(todo)} of {len(chunks)} chunks "
+              f"({len(chunks) - len(todo)} already on disk) with {self.max_workers} workers...")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(self._fetch, todo))
+        n_done = sum(results)
+        n_failed = len(results) - n_done
+        if n_failed:
+            print(f"Warning: {n_failed} chunks failed or hit the row limit; run again to retry "
+                  "only those chunks (replan truncated ones with smaller chunks).")
+        return n_done, n_failed
+
+    def iter_tables(self, chunks):
+        """Yield the stored Table of each ingested chunk, in the order given."""
+        for chunk in chunks:
+            if self.is_done(chunk):
+                yield Table.read(self._chunk_path(chunk), format='ascii.ecsv')
+
+    def load(self, chunks):
+        """All ingested rows of chunks as one Table (missing chunks are skipped)."""
+        tables = list(self.iter_tables(chunks))
+        return vstack(tables) if tables else empty_chunk_table()
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from fake_sdss import FakeSDSS, random_box_catalog
+    from footprint import STRIPE82_BOXES
+
+    catalog = random_box_catalog(STRIPE82_BOXES, n_objects=20000, seed=1)
+    chunks = plan_chunks([(310, 360), (0, 60)], -1.25, 1.25, ra_step=5)
+    expected = np.sum((catalog['type'] == SDSS_GALAXY_TYPE) & (catalog['z'] >= 0.2) & (catalog['z'] <= 0.6))
+
+    with tempfile.TemporaryDirectory() as root:
+        for failure_rate in [0.6, 0.0]:
+            fake = FakeSDSS(catalog, latency=0.02, failure_rate=failure_rate)
+            ingest = ChunkIngest(root, sql_func=fake.query_sql, max_workers=4, max_retries=1,
+                                 backoff_base=0.01)
+            n_done, n_failed = ingest.run(chunks)
+            print(f"failure_rate={failure_rate}: {n_done} chunks fetched, {n_failed} failed, "
+                  f"{fake.n_requests} requests, peak in flight {fake.max_in_flight}")
+        galaxies = ingest.load(chunks)
+        print(f"{len(galaxies)} galaxies ingested, {expected} expected, "
+              f"{len(np.unique(galaxies['objID']))} unique")
+
+    # Adaptive planning against a fake with a small row limit and a dense clump
+    catalog = vstack([catalog, random_box_catalog([(20.0, 21.0, -0.5, 0.5)], n_objects=20000, seed=2)])
+    catalog['objID'] = 1237660000000000000 + np.arange(len(catalog), dtype=np.int64)
+    expected = np.sum((catalog['type'] == SDSS_GALAXY_TYPE) & (catalog['z'] >= 0.2) & (catalog['z'] <= 0.6))
+    with tempfile.TemporaryDirectory() as root:
+        fake = FakeSDSS(catalog, latency=0.01, max_rows=2000)
+        ingest = ChunkIngest(root, sql_func=fake.query_sql, max_rows=2000)
+        for ra_step in [5, None]:
+            cells = plan_chunks([(310, 360), (0, 60)], -1.25, 1.25, ra_step=ra_step)
+            chunks = cells if ra_step else ingest.plan(cells, target_rows=1000)
+            ingest.run(chunks)
+            print(f"{'fixed 5 deg' if ra_step else 'adaptive'}: {len(chunks)} chunks, "
+                  f"{len(ingest.failed(chunks))} truncated, {len(ingest.load(chunks))} of {expected} galaxies")
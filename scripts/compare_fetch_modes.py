@@ -0,0 +1,199 @@
+"""
+compare_fetch_modes.py
+
+Consistency harness for the SDSS fetch modes in sdss_fetch.py. For each recorded
+lens field fixture it replays the 'tiled', 'radial' and 'batched' fetch paths and
+checks they all return the same object set.
+
+A fixture is recorded once from SDSS with --record and stored under FIXTURE_DIR as
+two ECSV files (objID, ra, dec, type):
+
+- field_<ra>_<dec>.ecsv: the response to the radial SQL cone search (the field
+  radius plus one tile radius of margin), served to the 'radial' and 'batched'
+  paths by a local FakeSDSS;
+- tiles_<ra>_<dec>.ecsv: the actual SDSS.query_region response for every tile of
+  the field's tile plan, tagged with tile_idx, replayed tile by tile to the
+  'tiled' path.
+
+Each mode is thus compared on what the real service returned for its own query
+type (e.g. a difference in object scope between the cone search and the SQL
+function shows up as a mismatch). Without fixtures the harness falls back to
+synthetic fields, where all modes are served from one catalog; that only checks
+the client-side tiling, clipping, batching and deduplication.
+
+Usage:
+    python scripts/compare_fetch_modes.py                          # replay fixtures
+    python scripts/compare_fetch_modes.py --record RA DEC [RA DEC ...]   # record new ones
+"""
+
+import argparse
+import glob
+import os
+
+import numpy as np
+from astropy.coordinates import SkyCoord, Angle
+from astropy.table import Table, vstack
+import astropy.units as u
+
+from fake_sdss import FakeSDSS, random_catalog
+from sdss_fetch import iter_sdss_fields, query_sdss_field, radial_query_sql, sdss_region_query, sdss_sql_query
+from tile_planner import plan_hex_tiles
+
+FIXTURE_DIR = 'results/fixtures/sdss_fields'
+FIELD_RADIUS_DEG = 20 / 60
+TILE_RADIUS_ARCMIN = 3.0
+FIXTURE_FIELDS = ('objID', 'ra', 'dec', 'type')
+
+
+def fixture_path(ra, dec, kind='field'):
+    return os.path.join(FIXTURE_DIR, f'{kind}_{ra:.4f}_{dec:+.4f}.ecsv')
+
+
+def _empty_fixture_table():
+    return Table(names=FIXTURE_FIELDS, dtype=[np.int64, float, float, int])
+
+
+def record_fixture(ra, dec, radius_deg=FIELD_RADIUS_DEG, tile_radius_arcmin=TILE_RADIUS_ARCMIN):
+    """
+    Record the SDSS responses for the field around (ra, dec): the radial SQL cone
+    search (with a tile radius of margin, so batched and radial replays see every
+    object they would online) and the query_region response of every tile of the
+    field's tile plan. Returns the two fixture paths.
+    """
+    center = SkyCoord(ra=ra, dec=dec, unit='deg')
+    radius_arcmin = radius_deg * 60.0 + tile_radius_arcmin
+    catalog = sdss_sql_query(radial_query_sql(ra, dec, radius_arcmin, FIXTURE_FIELDS))
+    if catalog is None:
+        catalog = _empty_fixture_table()
+    catalog.meta.update({'ra': ra, 'dec': dec, 'radius_deg': radius_deg})
+
+    plan = plan_hex_tiles(center, radius_deg, tile_radius_arcmin)
+    tile_radius = Angle(tile_radius_arcmin, u.arcmin)
+    tile_tables = []
+    for idx, tile_center in enumerate(plan.centers):
+        result = sdss_region_query(tile_center, tile_radius, FIXTURE_FIELDS)
+        result = result[list(FIXTURE_FIELDS)] if result is not None else _empty_fixture_table()
+        result.add_column(np.full(len(result), idx), name='tile_idx', index=0)
+        tile_tables.append(result)
+    tiles = vstack(tile_tables)
+    tiles.meta.update({'ra': ra, 'dec': dec, 'tile_radius_arcmin': tile_radius_arcmin,
+                       'tile_ra': plan.centers.ra.deg.tolist(), 'tile_dec': plan.centers.dec.deg.tolist()})
+
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    paths = (fixture_path(ra, dec), fixture_path(ra, dec, 'tiles'))
+    catalog.write(paths[0], format='ascii.ecsv', overwrite=True)
+    tiles.write(paths[1], format='ascii.ecsv', overwrite=True)
+    print(f"Recorded {len(catalog)} objects (radial) and {len(tiles)} rows from {len(plan.centers)} tiles "
+          f"to {paths[0]} and {paths[1]}")
+    return paths
+
+
+class RecordedTiles:
+    """
+    Replays recorded query_region tile responses: called as query_func(tile_center,
+    radius) by sdss_fetch.iter_sdss_tiled, it returns the rows recorded for the
+    tile centred within 1e-6 deg of tile_center. An unrecorded tile (e.g. after a
+    change to the tile planner) raises KeyError, so the fixture must be re-recorded.
+    """
+
+    def __init__(self, tiles):
+        self.tiles = tiles
+        self.tile_ra = np.asarray(tiles.meta['tile_ra'])
+        self.tile_dec = np.asarray(tiles.meta['tile_dec'])
+
+    def __call__(self, tile_center, radius):
+        match = np.flatnonzero((np.abs(self.tile_ra - tile_center.ra.deg) < 1e-6)
+                               & (np.abs(self.tile_dec - tile_center.dec.deg) < 1e-6))
+        if len(match) == 0:
+            raise KeyError(f"No recorded tile at RA={tile_center.ra.deg:.6f}, DEC={tile_center.dec.deg:.6f}")
+        rows = self.tiles[self.tiles['tile_idx'] == match[0]]
+        rows.remove_column('tile_idx')
+        return rows if len(rows) > 0 else None
+
+
+def load_fixtures():
+    """
+    Yield (center_coord, catalog, tiles) for every recorded fixture; tiles is
+    None for fixtures recorded without tile responses.
+    """
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, 'field_*.ecsv'))):
+        catalog = Table.read(path, format='ascii.ecsv')
+        ra, dec = catalog.meta['ra'], catalog.meta['dec']
+        tiles_path = fixture_path(ra, dec, 'tiles')
+        tiles = Table.read(tiles_path, format='ascii.ecsv') if os.path.exists(tiles_path) else None
+        yield SkyCoord(ra=ra, dec=dec, unit='deg'), catalog, tiles
+
+
+def synthetic_fixtures(seed=0):
+    """Offline stand-ins covering low, mid and high declination fields."""
+    for i, (ra, dec) in enumerate([(150.0, 2.0), (20.0, -30.0), (210.0, 55.0)]):
+        center = SkyCoord(ra=ra, dec=dec, unit='deg')
+        radius_deg = FIELD_RADIUS_DEG + TILE_RADIUS_ARCMIN / 60.0
+        yield center, random_catalog(center, radius_deg, n_objects=3000, seed=seed + i), None
+
+
+def object_keys(table):
+    """Set of object identifiers: objID when present, else rounded positions."""
+    if 'objID' in table.colnames:
+        return set(np.asarray(table['objID']).tolist())
+    return set(zip(np.round(table['ra'], 6), np.round(table['dec'], 6)))
+
+
+def compare_field(center, catalog, tiles=None):
+    """
+    Run every fetch mode on one field and return {mode: object keys}. The tiled
+    path replays the recorded tile responses if given, else cone searches on catalog.
+    """
+    fake = FakeSDSS(catalog, latency=0.0)
+    tile_query = RecordedTiles(tiles) if tiles is not None else fake.query_region
+    tiled = query_sdss_field(center, FIELD_RADIUS_DEG, mode='tiled',
+                             tile_radius_arcmin=TILE_RADIUS_ARCMIN, max_in_flight=8,
+                             requests_per_second=None, query_func=tile_query)
+    radial = query_sdss_field(center, FIELD_RADIUS_DEG, mode='radial', sql_func=fake.query_sql)
+    # Query the field twice in one batch so row tagging and splitting are exercised too
+    batched = list(iter_sdss_fields([center, center], FIELD_RADIUS_DEG, mode='batched',
+                                    sql_func=fake.query_sql))
+    batched_keys = [object_keys(t) for t in batched]
+    return {'tiled': object_keys(tiled), 'radial': object_keys(radial),
+            'batched': batched_keys[0] if batched_keys[0] == batched_keys[1] else set()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--record', nargs='+', type=float, metavar='DEG',
+                        help='record fixtures for the given RA DEC pairs (requires network)')
+    args = parser.parse_args()
+
+    if args.record:
+        if len(args.record) % 2:
+            parser.error('--record expects RA DEC pairs')
+        for ra, dec in zip(args.record[::2], args.record[1::2]):
+            record_fixture(ra, dec)
+        return
+
+    fields = list(load_fixtures())
+    recorded = bool(fields)
+    if not recorded:
+        print(f"No fixtures found in {FIXTURE_DIR}; using synthetic fields "
+              f"(all modes served from one catalog, so only the client-side paths are compared).")
+        fields = list(synthetic_fixtures())
+
+    n_mismatch = 0
+    for center, catalog, tiles in fields:
+        if recorded and tiles is None:
+            print(f"RA={center.ra.deg:.4f}, DEC={center.dec.deg:+.4f}: no recorded tile responses; "
+                  f"tiled mode is served from the radial catalog")
+        keys = compare_field(center, catalog, tiles)
+        reference = keys['radial']
+        ok = all(k == reference for k in keys.values())
+        n_mismatch += not ok
+        summary = ', '.join(f"{mode}={len(k)} (+{len(k - reference)}/-{len(reference - k)})"
+                            for mode, k in keys.items())
+        print(f"RA={center.ra.deg:.4f}, DEC={center.dec.deg:+.4f}: {summary} -> {'OK' if ok else 'MISMATCH'}")
+
+    print(f"\n{len(fields) - n_mismatch}/{len(fields)} fields returned identical object sets.")
+    raise SystemExit(1 if n_mismatch else 0)
+
+
+if __name__ == "__main__":
+    main()
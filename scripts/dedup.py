@@ -0,0 +1,92 @@
+"""
+dedup.py
+
+Streaming deduplication of catalog rows merged from overlapping queries.
+
+Overlapping tiles return the same objects several times. StreamingDeduplicator
+consumes result Tables one at a time as they arrive and passes on only rows not
+seen before, so the duplicated union is never built. Rows are keyed on the SDSS
+objID when the table has one, otherwise on RA/Dec quantized to a fixed grid (exact
+float matching via group_by(['ra', 'dec']) is slow and breaks on round-off).
+
+Each row costs one hash-set lookup, so the whole stream is deduplicated in O(n).
+
+Usage:
+    dedup = StreamingDeduplicator()
+    for table in tile_results:
+        new_rows = dedup.add(table)
+"""
+
+import numpy as np
+from astropy.table import vstack
+
+# Quantization step for position keys; far below SDSS astrometric precision
+POSITION_PRECISION_ARCSEC = 0.01
+
+
+def position_keys(ra, dec, precision_arcsec=POSITION_PRECISION_ARCSEC):
+    """
+    Integer keys for RA/Dec (degrees) quantized to precision_arcsec. Positions
+    that round to the same grid cell share a key.
+    """
+    step = precision_arcsec / 3600.0
+    ra_idx = np.round((np.asarray(ra, dtype=float) % 360.0) / step).astype(np.int64)
+    dec_idx = np.round((np.asarray(dec, dtype=float) + 90.0) / step).astype(np.int64)
+    return ra_idx * (int(round(180.0 / step)) + 1) + dec_idx
+
+
+class StreamingDeduplicator:
+    """
+    Incremental, hash-based row deduplication across a stream of Tables.
+
+    Keys on id_column when present in a table, else on quantized RA/Dec. The first
+    occurrence of each object is kept. n_rows (rows added), n_duplicates and
+    n_unique track totals for redundancy reporting.
+    """
+
+    def __init__(self, id_column='objID', precision_arcsec=POSITION_PRECISION_ARCSEC):
+        self.id_column = id_column
+        self.precision_arcsec = precision_arcsec
+        self._seen = set()
+        self.n_rows = 0
+        self.n_duplicates = 0
+
+    @property
+    def n_unique(self):
+        return len(self._seen)
+
+    def keys(self, table):
+        """Deduplication key for each row of table."""
+        if self.id_column in table.colnames:
+            return np.asarray(table[self.id_column], dtype=np.int64)
+        return position_keys(table['ra'], table['dec'], self.precision_arcsec)
+
+    def add(self, table):
+        """
+        Register the rows of table and return only those not seen before
+        (including duplicates within table itself).
+        """
+        if table is None or len(table) == 0:
+            return table
+        keys = self.keys(table)
+        # First occurrence within this batch, in original row order
+        _, first = np.unique(keys, return_index=True)
+        first.sort()
+        seen = self._seen
+        new = np.fromiter((k not in seen for k in keys[first].tolist()), dtype=bool, count=len(first))
+        keep = first[new]
+        seen.update(keys[keep].tolist())
+
+        self.n_rows += len(table)
+        self.n_duplicates += len(table) - len(keep)
+        return table[keep]
+
+
+def dedup_tables(tables, id_column='objID', precision_arcsec=POSITION_PRECISION_ARCSEC):
+    """
+    Deduplicate an iterable of Tables and stack the unique rows. Returns None if
+    nothing was found.
+    """
+    dedup = StreamingDeduplicator(id_column=id_column, precision_arcsec=precision_arcsec)
+    unique = [t for t in (dedup.add(table) for table in tables) if t is not None and len(t) > 0]
+    return vstack(unique) if unique else None
@@ -0,0 +1,121 @@
+"""
+distance_tables.py
+
+Precomputed, interpolated cosmological distance tables.
+
+Every angular_diameter_distance / luminosity_distance call in astropy runs a
+numerical integral, once per galaxy and per lens. DistanceTable evaluates the
+transverse comoving distance D_M(z) once on a dense grid uniform in ln(1+z) and
+interpolates it with a cubic spline; D_A = D_M / (1+z) and D_L = D_M * (1+z)
+follow exactly from it.
+
+The grid is refined (doubled) until the maximum relative interpolation error,
+measured against astropy at every grid midpoint where spline error peaks, is
+below rtol / SAFETY_FACTOR, so off-midpoint errors also stay below rtol
+(1e-7 by default). Tables are saved to DISTANCE_CACHE_DIR under a hash
+of the cosmology's parameters and the grid settings, so they are rebuilt only
+when the cosmology changes.
+
+Usage:
+    from distance_tables import distance_table
+    d_a = distance_table().angular_diameter_distance(z)   # Mpc, Planck18
+    d_l = distance_table(cosmo).luminosity_distance(z)
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import astropy.units as u
+from astropy.cosmology import Planck18
+from scipy.interpolate import CubicSpline
+
+DISTANCE_CACHE_DIR = './distance_tables'
+TABLE_VERSION = 1
+SAFETY_FACTOR = 4.0
+
+
+def cosmology_hash(cosmology, z_max, rtol):
+    """Stable hash of the cosmology parameters and table settings."""
+    params = cosmology.to_format('mapping')
+    params.pop('meta', None)
+    payload = json.dumps({'class': type(cosmology).__name__, 'params': params, 'z_max': z_max,
+                          'rtol': rtol, 'version': TABLE_VERSION}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class DistanceTable:
+    """
+    Spline interpolation of D_M(z) for one cosmology over 0 <= z <= z_max.
+
+    Distances are returned as plain float arrays in Mpc; redshifts outside the
+    table range or not finite give NaN. max_rel_error is the largest relative
+    error measured at the grid midpoints.
+    """
+
+    def __init__(self, cosmology=Planck18, z_max=5.0, rtol=1e-7, cache_dir=DISTANCE_CACHE_DIR,
+                 n_initial=256, n_max=2**16):
+        self.cosmology = cosmology
+        self.z_max = z_max
+        self.rtol = rtol
+        key = cosmology_hash(cosmology, z_max, rtol)
+        path = os.path.join(cache_dir, f'distances_{key}.npz') if cache_dir else None
+
+        if path and os.path.exists(path):
+            saved = np.load(path)
+            x, d_m, self.max_rel_error = saved['x'], saved['d_m'], float(saved['max_rel_error'])
+        else:
+            x, d_m, self.max_rel_error = self._build(n_initial, n_max)
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = path + '.tmp.npz'
+                np.savez(tmp_path, x=x, d_m=d_m, max_rel_error=self.max_rel_error)
+                os.replace(tmp_path, path)
+
+        self._spline = CubicSpline(x, d_m)
+
+    def _exact_d_m(self, z):
+        return self.cosmology.comoving_transverse_distance(z).to_value(u.Mpc)
+
+    def _build(self, n, n_max):
+        """Refine the ln(1+z) grid until midpoint errors are below rtol / SAFETY_FACTOR."""
+        x_max = np.log1p(self.z_max)
+        while True:
+            x = np.linspace(0.0, x_max, n + 1)
+            d_m = self._exact_d_m(np.expm1(x))
+            x_mid = 0.5 * (x[1:] + x[:-1])
+            exact_mid = self._exact_d_m(np.expm1(x_mid))
+            max_rel_error = float(np.max(np.abs(CubicSpline(x, d_m)(x_mid) / exact_mid - 1)))
+            if max_rel_error <= self.rtol / SAFETY_FACTOR or n >= n_max:
+                if max_rel_error > self.rtol / SAFETY_FACTOR:
+                    print(f"Warning: distance table reached {n} intervals with max relative "
+                          f"error {max_rel_error:.1e} above target {self.rtol / SAFETY_FACTOR:.1e}")
+                return x, d_m, max_rel_error
+            n *= 2
+
+    def comoving_transverse_distance(self, z):
+        z = np.asarray(z, dtype=float)
+        valid = np.isfinite(z) & (z >= 0) & (z <= self.z_max)
+        x = np.log1p(np.where(valid, z, 0.0))
+        return np.where(valid, self._spline(x), np.nan)
+
+    def angular_diameter_distance(self, z):
+        """D_A(z) in Mpc."""
+        return self.comoving_transverse_distance(z) / (1 + np.asarray(z, dtype=float))
+
+    def luminosity_distance(self, z):
+        """D_L(z) in Mpc."""
+        return self.comoving_transverse_distance(z) * (1 + np.asarray(z, dtype=float))
+
+
+_tables = {}
+
+
+def distance_table(cosmology=Planck18, **kwargs):
+    """Shared DistanceTable for cosmology (built or loaded on first use)."""
+    key = (cosmology_hash(cosmology, kwargs.get('z_max', 5.0), kwargs.get('rtol', 1e-7)),
+           kwargs.get('cache_dir', DISTANCE_CACHE_DIR))
+    if key not in _tables:
+        _tables[key] = DistanceTable(cosmology, **kwargs)
+    return _tables[key]
@@ -0,0 +1,182 @@
+"""
+fake_sdss.py
+
+Local, in-process stand-in for astroquery's SDSS service, used to exercise the
+fetch engines in sdss_fetch.py without network access.
+
+FakeSDSS serves cone searches from a synthetic (or recorded) catalog Table and
+injects a configurable latency per request. It records how many requests it has
+served and the peak number of requests in flight, so concurrency limits can be
+checked directly. query_sql() understands the fGetNearbyObj[All]Eq() cone searches
+issued by sdss_fetch.py and the RA/Dec box queries issued by chunk_ingest.py.
+
+Usage:
+    python scripts/fake_sdss.py     # times serial vs concurrent tile fetching
+"""
+
+import re
+import threading
+import time
+
+import numpy as np
+from astropy.coordinates import SkyCoord, Angle
+from astropy.table import Table, vstack
+import astropy.units as u
+
+
+def random_catalog(center_coord, radius_deg, n_objects=5000, galaxy_fraction=0.6, seed=0):
+    """
+    Synthetic photometric catalog of n_objects spread uniformly over a disc of
+    radius_deg around center_coord. Columns: objID, ra, dec, type (6=galaxy, 3/others).
+    """
+    rng = np.random.default_rng(seed)
+    r = radius_deg * np.sqrt(rng.uniform(0, 1, n_objects))
+    phi = rng.uniform(0, 2 * np.pi, n_objects)
+    dec = center_coord.dec.deg + r * np.sin(phi)
+    ra = (center_coord.ra.deg + r * np.cos(phi) / np.cos(np.radians(dec))) % 360
+    obj_type = np.where(rng.uniform(0, 1, n_objects) < galaxy_fraction, 6, 3)
+    obj_id = 1237650000000000000 + np.arange(n_objects, dtype=np.int64)
+    return Table([obj_id, ra, dec, obj_type], names=['objID', 'ra', 'dec', 'type'])
+
+
+def random_box_catalog(boxes, n_objects=20000, z_range=(0.0, 1.0), galaxy_fraction=0.6, seed=0):
+    """
+    Synthetic spectroscopic catalog of n_objects spread uniformly over RA/Dec boxes
+    (see random_fields.sample_boxes). Columns: objID, ra, dec, type (3=galaxy), z.
+    """
+    from random_fields import sample_boxes
+
+    rng = np.random.default_rng(seed)
+    ra, dec = sample_boxes(n_objects, boxes, rng)
+    obj_type = np.where(rng.uniform(0, 1, n_objects) < galaxy_fraction, 3, 6)
+    z = rng.uniform(*z_range, n_objects)
+    obj_id = 1237660000000000000 + np.arange(n_objects, dtype=np.int64)
+    return Table([obj_id, ra, dec, obj_type, z], names=['objID', 'ra', 'dec', 'type', 'z'])
+
+
+def _box_rows(catalog, sql):
+    """
+    Rows of catalog passing every "alias.column <op> number" and
+    "alias.column BETWEEN a AND b" condition of sql, with the selected columns
+    (or a one-row table for "SELECT COUNT(*) AS <name>").
+    """
+    mask = np.ones(len(catalog), dtype=bool)
+    for column, lo, hi in _BETWEEN_RE.findall(sql):
+        values = np.asarray(catalog[column])
+        mask &= (values >= float(lo)) & (values <= float(hi))
+    for column, op, value in _COMPARE_RE.findall(sql):
+        mask &= _OPS[op](np.asarray(catalog[column]), float(value))
+    columns = _SELECT_RE.search(sql).group(1)
+    if columns.upper().startswith('COUNT(*)'):
+        return Table([[np.count_nonzero(mask)]], names=[columns.split()[-1]])
+    return catalog[mask][[name.split('.')[-1].strip() for name in columns.split(',')]]
+
+
+class FakeSDSS:
+    """
+    Minimal SDSS look-alike serving cone searches from an in-memory catalog.
+
+    latency is the mean per-request delay in seconds (jitter adds uniform noise of
+    that half-width); failure_rate is the probability a request raises. max_rows,
+    if set, truncates SQL responses like the SkyServer row limit.
+    """
+
+    def __init__(self, catalog, latency=0.2, jitter=0.0, failure_rate=0.0, max_rows=None, seed=0):
+        self.catalog = catalog
+        self.max_rows = max_rows
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._rng = np.random.default_rng(seed)
+        self._coords = SkyCoord(ra=catalog['ra'], dec=catalog['dec'], unit='deg')
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.n_requests = 0
+        self.max_in_flight = 0
+
+    def _enter(self):
+        with self._lock:
+            self.n_requests += 1
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+            delay = self.latency + self.jitter * self._rng.uniform(-1, 1)
+            fail = self._rng.uniform() < self.failure_rate
+        time.sleep(max(0.0, delay))
+        return fail
+
+    def _exit(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def query_region(self, coordinates, radius, spectro=False, photoobj_fields=None, **kwargs):
+        """Cone search with the astroquery SDSS.query_region calling convention."""
+        try:
+            if self._enter():
+                raise ConnectionError("injected failure")
+            mask = self._coords.separation(coordinates) <= Angle(radius)
+            if not mask.any():
+                return None
+            result = self.catalog[mask]
+            if photoobj_fields is not None:
+                result = result[list(photoobj_fields)]
+            return result
+        finally:
+            self._exit()
+
+    def query_sql(self, sql, **kwargs):
+        """
+        Answer the fGetNearbyObj[All]Eq(ra, dec, radius_arcmin) cone searches in sql,
+        or a WHERE-clause box query over catalog columns (see _box_rows).
+        UNION ALL parts tagged with "<n> AS field_idx" keep that tag as a column.
+        """
+        try:
+            if self._enter():
+                raise ConnectionError("injected failure")
+            parts = []
+            for part in sql.split('UNION ALL'):
+                match = _NEARBY_RE.search(part)
+                if match is not None:
+                    ra, dec, radius_arcmin = (float(g) for g in match.groups())
+                    center = SkyCoord(ra=ra, dec=dec, unit='deg')
+                    rows = self.catalog[self._coords.separation(center) <= Angle(radius_arcmin, u.arcmin)]
+                elif 'WHERE' in part:
+                    rows = _box_rows(self.catalog, part)
+                else:
+                    raise ValueError("FakeSDSS.query_sql only supports fGetNearbyObj[All]Eq and box queries")
+                tag = _FIELD_IDX_RE.search(part)
+                if tag is not None:
+                    rows.add_column(np.full(len(rows), int(tag.group(1))), name='field_idx', index=0)
+                parts.append(rows)
+            result = vstack(parts)
+            if len(result) == 0:
+                return None
+            if self.max_rows is not None:
+                result = result[:self.max_rows]
+            return result
+        finally:
+            self._exit()
+
+
+_NUMBER = r'([-+]?[\d.]+(?:[eE][-+]?\d+)?)'
+_NEARBY_RE = re.compile(r'fGetNearbyObj(?:All)?Eq\(\s*' + r'\s*,\s*'.join([_NUMBER] * 3) + r'\s*\)')
+_FIELD_IDX_RE = re.compile(r'SELECT\s+(\d+)\s+AS\s+field_idx')
+_SELECT_RE = re.compile(r'SELECT\s+(.*?)\s+FROM', re.DOTALL)
+_BETWEEN_RE = re.compile(r'\w+\.(\w+)\s+BETWEEN\s+' + _NUMBER + r'\s+AND\s+' + _NUMBER)
+_COMPARE_RE = re.compile(r'\w+\.(\w+)\s*(>=|<=|<|>|=)\s*' + _NUMBER)
+_OPS = {'>=': np.greater_equal, '<=': np.less_equal, '<': np.less, '>': np.greater, '=': np.equal}
+
+
+if __name__ == "__main__":
+    from sdss_fetch import query_sdss_tiled
+
+    center = SkyCoord(ra=150.0, dec=2.0, unit='deg')
+    catalog = random_catalog(center, radius_deg=0.4)
+
+    for max_in_flight, rate in [(1, None), (4, None), (8, 20.0)]:
+        fake = FakeSDSS(catalog, latency=0.05)
+        start = time.perf_counter()
+        galaxies = query_sdss_tiled(center, max_in_flight=max_in_flight, requests_per_second=rate,
+                                    query_func=fake.query_region)
+        elapsed = time.perf_counter() - start
+        print(f"max_in_flight={max_in_flight}, rate={rate}: {fake.n_requests} requests, "
+              f"peak in flight {fake.max_in_flight}, {len(galaxies)} rows in {elapsed:.2f} s")
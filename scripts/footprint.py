@@ -0,0 +1,204 @@
+"""
+footprint.py
+
+Survey footprints and masks as HEALPix pixel sets (MOC-style coverage maps).
+
+A Footprint is a sorted set of NESTED HEALPix pixels at one order
+(nside = 2**order). Because every pixel has the same area:
+
+- contains(ra, dec) is one ang2pix call plus a binary search, for any number of
+  points and any footprint shape (RA wrap and poles need no special cases);
+- area is the pixel count times the pixel area;
+- sample(n) is exactly uniform on the sphere: pick pixels uniformly, then a random
+  NESTED descendant at order 29 (~0.4 mas), whose centre is the sample;
+- union (|), intersection (&) and difference (-) are sorted-set operations after
+  bringing both operands to the finer order, so edge or bright-star masks combine
+  with survey coverage without touching individual points.
+
+Footprints are saved as multi-order coverage (MOC) "uniq" indices (complete sets of
+four sibling pixels merged into their parent), which keeps large contiguous areas
+such as the SDSS DR imaging footprint small on disk.
+
+Usage:
+    from footprint import Footprint, STRIPE82_BOXES
+    stripe82 = Footprint.from_boxes(STRIPE82_BOXES, order=12)
+    stars = Footprint.from_cones(star_ra, star_dec, radius_deg=2/60, order=12)
+    usable = stripe82 - stars
+    ra, dec = usable.sample(1000, seed=1)
+    usable.save('footprints/stripe82_masked.npy')
+
+Requires: healpy, numpy
+"""
+
+import healpy as hp
+import numpy as np
+
+MAX_ORDER = 29
+DEFAULT_ORDER = 10  # nside 1024, ~3.4 arcmin pixels
+
+# Stripe 82 footprint as (ra_min, ra_max, dec_min, dec_max) boxes in degrees
+STRIPE82_BOXES = [(310.0, 360.0, -1.25, 1.25), (0.0, 60.0, -1.25, 1.25)]
+
+
+def ra_width(ra_min, ra_max):
+    """RA extent in degrees; ra_min > ra_max wraps through RA=0, (0, 360) is the full circle."""
+    width = np.mod(np.subtract(ra_max, ra_min), 360.0)
+    return np.where((width == 0) & (np.asarray(ra_max) != np.asarray(ra_min)), 360.0, width)
+
+
+def children(pixels, order, new_order):
+    """All NESTED descendants at new_order (>= order) of pixels, sorted if pixels is."""
+    k = new_order - order
+    pixels = np.asarray(pixels, dtype=np.int64)
+    if k == 0:
+        return pixels
+    return (pixels[:, None] * 4**k + np.arange(4**k, dtype=np.int64)[None, :]).ravel()
+
+
+class Footprint:
+    """
+    Set of NESTED HEALPix pixels at a single order describing sky coverage.
+    """
+
+    def __init__(self, pixels, order=DEFAULT_ORDER):
+        if not 0 <= order <= MAX_ORDER:
+            raise ValueError(f"order must be between 0 and {MAX_ORDER}, got {order}")
+        self.order = int(order)
+        self.pixels = np.unique(np.asarray(pixels, dtype=np.int64))
+
+    @property
+    def nside(self):
+        return 2**self.order
+
+    def __len__(self):
+        return len(self.pixels)
+
+    def __repr__(self):
+        return f"Footprint(order={self.order}, n_pixels={len(self)}, area={self.area_deg2():.2f} deg^2)"
+
+    # --- Construction ---
+
+    @classmethod
+    def from_boxes(cls, boxes, order=DEFAULT_ORDER):
+        """
+        Pixels whose centres lie in any (ra_min, ra_max, dec_min, dec_max) box;
+        ra_min > ra_max wraps through RA=0. Edges are accurate to half a pixel.
+        """
+        nside = 2**order
+        parts = []
+        for ra_min, ra_max, dec_min, dec_max in boxes:
+            # RING strips are contiguous index ranges; only the kept pixels are converted to NESTED
+            band = hp.query_strip(nside, np.radians(90 - dec_max), np.radians(90 - dec_min))
+            ra, dec = hp.pix2ang(nside, band, lonlat=True)
+            inside = ((ra - ra_min) % 360.0 <= ra_width(ra_min, ra_max)) & (dec >= dec_min) & (dec <= dec_max)
+            parts.append(hp.ring2nest(nside, band[inside]))
+        return cls(np.concatenate(parts) if parts else [], order)
+
+    @classmethod
+    def from_positions(cls, ra, dec, order=DEFAULT_ORDER):
+        """Pixels containing at least one of the positions (e.g. a survey's object catalog)."""
+        return cls(hp.ang2pix(2**order, np.asarray(ra, dtype=float), np.asarray(dec, dtype=float),
+                              nest=True, lonlat=True), order)
+
+    @classmethod
+    def from_cones(cls, ra, dec, radius_deg, order=DEFAULT_ORDER, inclusive=True):
+        """
+        Pixels overlapping (inclusive=True, conservative for masks) or centred in
+        cones of radius_deg (scalar or per-cone) around the positions.
+        """
+        nside = 2**order
+        ra, dec = np.atleast_1d(ra).astype(float), np.atleast_1d(dec).astype(float)
+        radii = np.radians(np.broadcast_to(np.asarray(radius_deg, dtype=float), ra.shape))
+        vectors = hp.ang2vec(ra, dec, lonlat=True).reshape(-1, 3)
+        parts = [hp.query_disc(nside, vec, radius, inclusive=inclusive, nest=True)
+                 for vec, radius in zip(vectors, radii)]
+        return cls(np.concatenate(parts) if parts else [], order)
+
+    @classmethod
+    def from_uniq(cls, uniq, order=None):
+        """Footprint from MOC uniq indices (4 * 4**order + pixel), at order (default: finest present)."""
+        uniq = np.asarray(uniq, dtype=np.int64)
+        if len(uniq) == 0:
+            return cls([], order if order is not None else DEFAULT_ORDER)
+        orders = (np.floor(np.log2(uniq)).astype(np.int64) - 2) // 2
+        pixels = uniq - 4 * 4**orders
+        target = int(orders.max()) if order is None else order
+        if orders.max() > target:
+            raise ValueError(f"MOC contains cells at order {orders.max()}, finer than requested order {target}")
+        return cls(np.concatenate([children(pixels[orders == o], o, target) for o in np.unique(orders)]),
+                   target)
+
+    @classmethod
+    def load(cls, path, order=None):
+        """Load a footprint saved with save()."""
+        return cls.from_uniq(np.load(path), order)
+
+    # --- Queries ---
+
+    def contains(self, ra, dec):
+        """Boolean mask of the positions (degrees) that fall inside the footprint."""
+        ra = np.asarray(ra, dtype=float)
+        dec = np.asarray(dec, dtype=float)
+        if len(self.pixels) == 0:
+            return np.zeros(np.broadcast(ra, dec).shape, dtype=bool)
+        pix = hp.ang2pix(self.nside, ra, dec, nest=True, lonlat=True)
+        idx = np.minimum(np.searchsorted(self.pixels, pix), len(self.pixels) - 1)
+        return self.pixels[idx] == pix
+
+    def area_sr(self):
+        return len(self.pixels) * hp.nside2pixarea(self.nside)
+
+    def area_deg2(self):
+        return len(self.pixels) * hp.nside2pixarea(self.nside, degrees=True)
+
+    def sample(self, n, rng=None, seed=None):
+        """n positions (ra, dec in degrees) drawn uniformly over the footprint."""
+        if len(self.pixels) == 0:
+            raise ValueError("cannot sample from an empty footprint")
+        rng = rng if rng is not None else np.random.default_rng(seed)
+        pix = self.pixels[rng.integers(0, len(self.pixels), n)]
+        k = MAX_ORDER - self.order
+        sub = pix * 4**k + rng.integers(0, 4**k, n, dtype=np.int64)
+        return hp.pix2ang(2**MAX_ORDER, sub, nest=True, lonlat=True)
+
+    # --- Set operations ---
+
+    def at_order(self, order):
+        """The same coverage at a finer order (coarsening would change the coverage)."""
+        if order < self.order:
+            raise ValueError(f"cannot refine order {self.order} footprint to coarser order {order}")
+        return Footprint(children(self.pixels, self.order, order), order)
+
+    def _aligned(self, other):
+        order = max(self.order, other.order)
+        return self.at_order(order).pixels, other.at_order(order).pixels, order
+
+    def __or__(self, other):
+        a, b, order = self._aligned(other)
+        return Footprint(np.union1d(a, b), order)
+
+    def __and__(self, other):
+        a, b, order = self._aligned(other)
+        return Footprint(np.intersect1d(a, b, assume_unique=True), order)
+
+    def __sub__(self, other):
+        a, b, order = self._aligned(other)
+        return Footprint(np.setdiff1d(a, b, assume_unique=True), order)
+
+    # --- Serialization ---
+
+    def to_uniq(self):
+        """MOC uniq indices, with complete sets of four siblings merged into their parent."""
+        pixels, parts = self.pixels, []
+        for order in range(self.order, 0, -1):
+            parents, counts = np.unique(pixels // 4, return_counts=True)
+            full = parents[counts == 4]
+            partial = ~np.isin(pixels // 4, full)
+            parts.append(4 * 4**order + pixels[partial])
+            pixels = full
+        parts.append(4 + pixels)
+        return np.sort(np.concatenate(parts))
+
+    def save(self, path):
+        """Save as a .npy array of MOC uniq indices."""
+        np.save(path, self.to_uniq())
@@ -0,0 +1,227 @@
+"""
+galaxy_store.py
+
+Local master catalog of SDSS photometric objects, partitioned by HEALPix pixel,
+that answers lens-field cone searches offline.
+
+Lens fields overlap and get re-queried whenever the aperture changes. GalaxyStore
+ingests bulk PhotoObj extracts once and serves query_field(ra, dec, radius) from
+disk in milliseconds:
+
+- rows are partitioned by NESTED HEALPix pixel (nside=32 by default, ~1.8 deg
+  pixels, so a 20 arcmin field touches at most a few partitions);
+- each partition is a directory of per-column .npy files, memory-mapped on read;
+- the set of completely ingested pixels is recorded, so covers() can tell whether a
+  field can be served locally or must still go to SDSS. A pixel query that reaches
+  the SDSS row cap is split into its four child pixels (recursively), so a
+  truncated response never marks a pixel covered.
+
+sdss_fetch.query_sdss_field(..., store=store) and iter_sdss_fields(..., store=store)
+read covered fields from the store and only query SDSS for the rest.
+
+Usage:
+    python scripts/galaxy_store.py --root ./galaxy_store --ingest RA DEC RADIUS_DEG
+
+Requires: healpy, astropy, numpy (and astroquery for ingesting from SDSS)
+"""
+
+import argparse
+import json
+import os
+
+import healpy as hp
+import numpy as np
+from astropy.table import Table
+
+from sdss_fetch import DEFAULT_PHOTOOBJ_FIELDS, SDSS_MAX_ROWS, radial_query_sql, sdss_sql_query
+
+DEFAULT_NSIDE = 32
+MAX_SPLIT_NSIDE = 8192  # finest pixels (~0.4 arcmin) a capped pixel query is split into
+DEFAULT_COLUMNS = {'objID': 'int64', 'ra': 'float64', 'dec': 'float64', 'type': 'int16'}
+
+
+class GalaxyStore:
+    """
+    HEALPix-partitioned on-disk catalog with cone-search queries.
+
+    root holds meta.json (nside, column dtypes, covered pixels) and one
+    pix/<pixel>/ directory of column .npy files per non-empty partition.
+    """
+
+    def __init__(self, root, nside=DEFAULT_NSIDE, columns=None):
+        self.root = root
+        meta_path = os.path.join(root, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.nside = meta['nside']
+            self.columns = meta['columns']
+            self.covered = set(meta['covered'])
+        else:
+            self.nside = nside
+            self.columns = dict(columns or DEFAULT_COLUMNS)
+            self.covered = set()
+            os.makedirs(os.path.join(root, 'pix'), exist_ok=True)
+            self._save_meta()
+        self._partitions = {}
+
+    def _save_meta(self):
+        tmp_path = os.path.join(self.root, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'nside': self.nside, 'columns': self.columns,
+                       'covered': sorted(int(p) for p in self.covered)}, f)
+        os.replace(tmp_path, os.path.join(self.root, 'meta.json'))
+
+    def _pix_dir(self, pixel):
+        return os.path.join(self.root, 'pix', str(int(pixel)))
+
+    def _load_partition(self, pixel):
+        """Memory-mapped columns of one partition, or None if it has no rows."""
+        if pixel not in self._partitions:
+            pix_dir = self._pix_dir(pixel)
+            if os.path.isdir(pix_dir):
+                self._partitions[pixel] = {name: np.load(os.path.join(pix_dir, name + '.npy'), mmap_mode='r')
+                                           for name in self.columns}
+            else:
+                self._partitions[pixel] = None
+        return self._partitions[pixel]
+
+    def pixels_for_field(self, ra, dec, radius_deg):
+        """NESTED pixels overlapping the disc of radius_deg around (ra, dec)."""
+        vec = hp.ang2vec(ra, dec, lonlat=True)
+        return hp.query_disc(self.nside, vec, np.radians(radius_deg), inclusive=True, nest=True)
+
+    def covers(self, ra, dec, radius_deg):
+        """True if every pixel touching the field has been fully ingested."""
+        return all(int(p) in self.covered for p in self.pixels_for_field(ra, dec, radius_deg))
+
+    def ingest(self, table, covered_pixels=()):
+        """
+        Add the rows of table to their partitions, dropping objIDs already stored,
+        and mark covered_pixels as completely ingested.
+        """
+        if table is not None and len(table) > 0:
+            pixels = hp.ang2pix(self.nside, np.asarray(table['ra']), np.asarray(table['dec']),
+                                lonlat=True, nest=True)
+            order = np.argsort(pixels, kind='stable')
+            pixels = pixels[order]
+            bounds = np.flatnonzero(np.diff(pixels)) + 1
+            starts = np.concatenate([[0], bounds])
+            for start, idx in zip(starts, np.split(order, bounds)):
+                self._append(int(pixels[start]),
+                             {name: np.asarray(table[name][idx], dtype=dtype)
+                              for name, dtype in self.columns.items()})
+        self.covered.update(int(p) for p in covered_pixels)
+        self._save_meta()
+
+    def _append(self, pixel, new_columns):
+        existing = self._load_partition(pixel)
+        if existing is not None:
+            merged = {name: np.concatenate([np.asarray(existing[name]), new_columns[name]])
+                      for name in self.columns}
+        else:
+            merged = new_columns
+        _, keep = np.unique(merged['objID'], return_index=True)
+        keep.sort()
+
+        pix_dir = self._pix_dir(pixel)
+        os.makedirs(pix_dir, exist_ok=True)
+        self._partitions.pop(pixel, None)
+        for name in self.columns:
+            tmp_path = os.path.join(pix_dir, name + '.tmp.npy')
+            np.save(tmp_path, merged[name][keep])
+            os.replace(tmp_path, os.path.join(pix_dir, name + '.npy'))
+
+    def _fetch_pixel(self, nside, pixel, sql_func, fields, max_rows):
+        """
+        Objects in one NESTED pixel at nside, from one radial SQL query around its
+        centre; a response of max_rows or more rows (possibly truncated) is replaced
+        by the responses for the four child pixels. Returns (list of Tables,
+        complete), where complete is False if a pixel at MAX_SPLIT_NSIDE still hit the cap.
+        """
+        ra, dec = hp.pix2ang(nside, int(pixel), nest=True, lonlat=True)
+        radius_arcmin = hp.max_pixrad(nside, degrees=True) * 60.0 * 1.01
+        result = sql_func(radial_query_sql(ra, dec, radius_arcmin, fields))
+        if result is not None and len(result) >= max_rows:
+            if nside < MAX_SPLIT_NSIDE:
+                parts, complete = [], True
+                for child in range(4 * int(pixel), 4 * int(pixel) + 4):
+                    child_parts, child_complete = self._fetch_pixel(2 * nside, child, sql_func, fields, max_rows)
+                    parts.extend(child_parts)
+                    complete = complete and child_complete
+                return parts, complete
+            print(f"Warning: pixel {int(pixel)} at nside={nside} returned {len(result)} rows "
+                  f"(row cap {max_rows}); the response may be truncated")
+            complete = False
+        else:
+            complete = True
+        if result is None or len(result) == 0:
+            return [], complete
+        in_pixel = hp.ang2pix(nside, np.asarray(result['ra']), np.asarray(result['dec']),
+                              lonlat=True, nest=True) == pixel
+        return [result[in_pixel]], complete
+
+    def ingest_pixels(self, pixels, sql_func=None, max_rows=SDSS_MAX_ROWS):
+        """
+        Fetch every object in each HEALPix pixel from SDSS (one radial SQL query
+        around the pixel centre, split into child pixels while a query reaches
+        max_rows) and ingest it. A pixel is marked covered only if no query was
+        truncated.
+        """
+        sql_func = sql_func or sdss_sql_query
+        fields = tuple(self.columns) if set(self.columns) <= set(DEFAULT_PHOTOOBJ_FIELDS) else DEFAULT_PHOTOOBJ_FIELDS
+        for pixel in pixels:
+            parts, complete = self._fetch_pixel(self.nside, pixel, sql_func, fields, max_rows)
+            n_objects = sum(len(part) for part in parts)
+            for part in parts:
+                self.ingest(part)
+            if complete:
+                self.ingest(None, covered_pixels=[pixel])
+                print(f"Ingested pixel {int(pixel)}: {n_objects} objects")
+            else:
+                print(f"Warning: pixel {int(pixel)} ingested incompletely ({n_objects} objects); "
+                      f"not marked covered, its fields will still be queried from SDSS")
+
+    def ingest_field(self, ra, dec, radius_deg, sql_func=None):
+        """Ingest whichever pixels touching the field are not yet covered."""
+        missing = [p for p in self.pixels_for_field(ra, dec, radius_deg) if int(p) not in self.covered]
+        self.ingest_pixels(missing, sql_func=sql_func)
+
+    def query_field(self, ra, dec, radius_deg):
+        """
+        All stored objects within radius_deg of (ra, dec), as an astropy Table with
+        the store's columns. Only meaningful where covers() is True.
+        """
+        ra0, dec0 = np.radians(ra), np.radians(dec)
+        cos_radius = np.cos(np.radians(radius_deg))
+        parts = []
+        for pixel in self.pixels_for_field(ra, dec, radius_deg):
+            partition = self._load_partition(int(pixel))
+            if partition is None:
+                continue
+            ra_p, dec_p = np.radians(partition['ra']), np.radians(partition['dec'])
+            cos_sep = (np.sin(dec0) * np.sin(dec_p)
+                       + np.cos(dec0) * np.cos(dec_p) * np.cos(ra_p - ra0))
+            idx = np.flatnonzero(cos_sep >= cos_radius)
+            if idx.size:
+                parts.append({name: np.asarray(partition[name][idx]) for name in self.columns})
+
+        if parts:
+            data = {name: np.concatenate([p[name] for p in parts]) for name in self.columns}
+        else:
+            data = {name: np.empty(0, dtype=dtype) for name, dtype in self.columns.items()}
+        return Table(data, names=list(self.columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or inspect a local SDSS galaxy store.")
+    parser.add_argument('--root', default='./galaxy_store')
+    parser.add_argument('--nside', type=int, default=DEFAULT_NSIDE)
+    parser.add_argument('--ingest', nargs=3, type=float, metavar=('RA', 'DEC', 'RADIUS_DEG'),
+                        help='ingest every pixel touching this field from SDSS')
+    args = parser.parse_args()
+
+    store = GalaxyStore(args.root, nside=args.nside)
+    if args.ingest:
+        store.ingest_field(*args.ingest)
+    print(f"Store at {args.root}: nside={store.nside}, {len(store.covered)} pixels covered")
@@ -0,0 +1,106 @@
+"""
+galaxy_stream.py
+
+Streaming stages for galaxy ingest: deduplication, lens exclusion and aperture
+counting applied batch by batch, so a survey-sized catalog is never stacked into
+one Table.
+
+Tile and chunk readers (sdss_fetch.iter_sdss_tiled, chunk_ingest.ChunkIngest.
+iter_tables) are generators of Tables. The stages here consume such a stream and
+either yield filtered batches (dedup_stream, exclude_stream) or fold them into a
+small running result (ApertureCounter). Aperture counts are additive over
+disjoint batches, so counting one batch at a time gives exactly the counts of the
+full catalog. Memory is bounded by one batch plus the running state: the
+dedup key set (one integer per unique object) and the per-centre counts.
+
+Usage:
+    exclusion = ExclusionFilter(lens_ra, lens_dec, radius_deg=5/60)
+    counter = ApertureCounter(random_ra, random_dec, radii_deg=[5/60, 10/60, 20/60])
+    counter.consume(exclude_stream(dedup_stream(ingest.iter_tables(chunks)), exclusion))
+    counts = counter.counts           # (n_centres, n_radii)
+
+Requires: scipy, astropy, numpy
+"""
+
+import numpy as np
+
+from dedup import StreamingDeduplicator
+from sky_index import SkyTree
+
+
+def dedup_stream(tables, dedup=None):
+    """
+    Yield the rows of each table not seen in any earlier one (see dedup.py),
+    skipping empty batches. Pass dedup to read its totals afterwards.
+    """
+    dedup = dedup if dedup is not None else StreamingDeduplicator()
+    for table in tables:
+        new_rows = dedup.add(table)
+        if new_rows is not None and len(new_rows) > 0:
+            yield new_rows
+
+
+class ExclusionFilter:
+    """
+    Removes rows within radius_deg of any exclusion-catalog position (e.g. known
+    lenses). The exclusion tree is built once and reused for every batch; n_rows,
+    n_excluded and the set of exclusion entries that removed at least one row
+    accumulate across batches.
+    """
+
+    def __init__(self, exclude_ra, exclude_dec, radius_deg):
+        self.tree = SkyTree(exclude_ra, exclude_dec)
+        self.radius_deg = radius_deg
+        self.n_rows = 0
+        self.n_excluded = 0
+        self.excluding = set()
+
+    def filter(self, table):
+        """The rows of table further than radius_deg from every exclusion entry."""
+        excluded_by, _ = self.tree.nearest_within(table['ra'], table['dec'], self.radius_deg)
+        keep = excluded_by < 0
+        self.n_rows += len(table)
+        self.n_excluded += int(np.count_nonzero(~keep))
+        self.excluding.update(np.unique(excluded_by[~keep]).tolist())
+        return table[keep]
+
+
+def exclude_stream(tables, exclusion):
+    """Yield each table filtered by exclusion (an ExclusionFilter)."""
+    for table in tables:
+        kept = exclusion.filter(table)
+        if len(kept) > 0:
+            yield kept
+
+
+class ApertureCounter:
+    """
+    Running galaxy counts within several radii around fixed centres.
+
+    radii_deg may be a scalar (counts has shape (N,)) or a sequence (N, R), as in
+    SkyTree.count_within. Each added batch is indexed on its own and its counts
+    are added to the totals.
+    """
+
+    def __init__(self, ra, dec, radii_deg):
+        self.ra = np.asarray(ra, dtype=float)
+        self.dec = np.asarray(dec, dtype=float)
+        self.radii_deg = radii_deg
+        shape = (len(self.ra),) if np.ndim(radii_deg) == 0 else (len(self.ra), len(radii_deg))
+        self.counts = np.zeros(shape, dtype=np.int64)
+        self.n_galaxies = 0
+        self.n_batches = 0
+
+    def add(self, table):
+        """Add the galaxies of one batch to the counts."""
+        if table is None or len(table) == 0:
+            return
+        self.counts += SkyTree(table['ra'], table['dec']).count_within(self.ra, self.dec, self.radii_deg)
+        self.n_galaxies += len(table)
+        self.n_batches += 1
+
+    def consume(self, tables):
+        """Add every batch of a stream; returns the final counts."""
+        for table in tables:
+            self.add(table)
+        return self.counts
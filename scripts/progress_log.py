@@ -0,0 +1,135 @@
+"""
+progress_log.py
+
+Append-only JSON Lines checkpoint log for long per-lens runs, with a compaction
+step that writes the final CSV or Parquet table once at the end.
+
+Rebuilding a DataFrame and rewriting the whole progress CSV after every lens costs
+O(n) per lens and O(n^2) over a run. ProgressWriter instead appends one JSON
+object per result to a .jsonl file:
+
+- every record is written and flushed to the OS immediately, so a crashed Python
+  process loses nothing;
+- os.fsync (the expensive part, protecting against OS crashes and power loss) runs
+  only every fsync_every records or fsync_interval seconds, and on close;
+- read_progress() tolerates a torn last line from an interrupted write.
+
+compact() turns the log into the final results table; the output format follows
+the file extension (.csv or .parquet).
+
+Usage:
+    with ProgressWriter('results/progress.jsonl') as progress:
+        for lens in lenses:
+            progress.write({'lens_id': ..., 'total_mass_Msun': ...})
+    compact('results/progress.jsonl', 'results/lens_stellar_mass.csv')
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from results_store import write_results
+
+
+def _to_json(value):
+    """json.dumps fallback for numpy scalars and arrays."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _truncate_torn_tail(path):
+    """Cut a partial last line (no trailing newline) left by an interrupted write."""
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+class ProgressWriter:
+    """
+    Append-only JSONL writer with batched fsync. Use as a context manager or call
+    close() so the tail of the log is synced.
+
+    With append=True an existing log is continued (after cutting off a torn last
+    line, so new records never merge into it); append=False starts a new log.
+    """
+
+    def __init__(self, path, fsync_every=25, fsync_interval=5.0, append=True):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if append and os.path.exists(path):
+            _truncate_torn_tail(path)
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8')
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.n_written = 0
+
+    def write(self, record):
+        """Append one record (a dict of JSON-serializable or numpy values)."""
+        self._file.write(json.dumps(record, default=_to_json) + '\n')
+        self._file.flush()
+        self.n_written += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        """Force the records written so far to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_progress(path):
+    """
+    Records of a progress log in write order. An unparsable last line (a write cut
+    short by a crash) is skipped with a warning; a missing file gives no records.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    records = []
+    for n, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            if n != len(lines) - 1:
+                raise
+            print(f"Warning: skipping incomplete last record in {path}")
+    return records
+
+
+def compact(log_path, out_path, columns=None, schema=None):
+    """
+    Write the records of log_path as one table to out_path (.csv or .parquet,
+    typed by schema; see results_store.py), with columns in the given order
+    (default: order of first appearance). Returns the DataFrame.
+    """
+    df = pd.DataFrame(read_progress(log_path), columns=columns)
+    write_results(df, out_path, schema)
+    return df
@@ -0,0 +1,248 @@
+"""
+query_cache.py
+
+Persistent, content-addressed disk cache for astroquery calls (SDSS, SIMBAD, IRSA,
+Vizier, NED, ...), so re-running an analysis after changing only the mass model
+costs no network time.
+
+Each response is stored under the SHA-256 of its key: the service name, the method
+name and the normalized call arguments (coordinates rounded to 1e-8 deg, angles in
+degrees, SQL whitespace collapsed, keyword order ignored). Entries expire after
+ttl_seconds, and the least recently used entries are evicted once the cache grows
+beyond max_bytes. Failed calls are never cached; empty (None) results are.
+
+Usage:
+    from astroquery.sdss import SDSS
+    from query_cache import ResponseCache, CachedService
+
+    cache = ResponseCache('./query_cache', ttl_seconds=30 * 86400, max_bytes=2e9)
+    sdss = CachedService(SDSS, 'SDSS', cache)
+    result = sdss.query_sql("SELECT TOP 10 ra, dec FROM PhotoObj")
+    cache.report()
+
+Services configured per instance (e.g. a Simbad() with extra votable fields) should
+encode that configuration in the service name, since it changes the response.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from astropy.coordinates import SkyCoord, Angle
+import astropy.units as u
+
+
+def normalize(value):
+    """
+    JSON-serializable canonical form of a query argument, so equivalent calls
+    produce the same cache key.
+    """
+    if isinstance(value, SkyCoord):
+        icrs = value.icrs
+        return {'ra': np.round(np.atleast_1d(icrs.ra.deg), 8).tolist(),
+                'dec': np.round(np.atleast_1d(icrs.dec.deg), 8).tolist()}
+    if isinstance(value, u.Quantity):
+        if value.unit.physical_type == 'angle':
+            return {'deg': np.round(np.atleast_1d(Angle(value).deg), 10).tolist()}
+        return {'value': np.atleast_1d(value.value).tolist(), 'unit': value.unit.to_string()}
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple, set)):
+        items = [normalize(v) for v in value]
+        return sorted(items, key=repr) if isinstance(value, set) else items
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return repr(value)
+
+
+def cache_key(service, method, args=(), kwargs=None):
+    """SHA-256 hex digest identifying a call to service.method(*args, **kwargs)."""
+    payload = json.dumps({'service': service, 'method': method,
+                          'args': normalize(list(args)), 'kwargs': normalize(kwargs or {})},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Disk cache of query responses with TTL expiry and size-based LRU eviction.
+
+    Entries live in cache_dir/<key[:2]>/<key>.pkl. A file's modification time is
+    refreshed on every hit and serves as its last-use time across runs; its
+    creation time is stored inside the entry for TTL checks.
+
+    The directory is scanned once at startup to build an in-memory LRU index
+    (path -> size, least recently used first) and a running total size; puts and
+    hits update both, so eviction only touches the filesystem when the total
+    exceeds max_bytes, and then only to delete the oldest entries.
+    """
+
+    def __init__(self, cache_dir, ttl_seconds=None, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.bytes_written = 0
+        self._index = OrderedDict((path, size) for _, size, path in sorted(self._entries()))
+        self._total = sum(self._index.values())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.pkl')
+
+    def get(self, key):
+        """Return (True, value) for a live entry, else (False, None)."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        if self.ttl_seconds is not None and time.time() - entry['created'] > self.ttl_seconds:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            with self._lock:
+                self._total -= self._index.pop(path, 0)
+            return False, None
+        try:
+            os.utime(path)
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        with self._lock:
+            self.bytes_saved += size
+            self._total += size - self._index.pop(path, 0)
+            self._index[path] = size
+        return True, entry['value']
+
+    def put(self, key, value, service=None):
+        """Store value under key (atomically), then evict if the cache exceeds max_bytes."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'created': time.time(), 'service': service, 'value': value}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self.bytes_written += size
+            self._total += size - self._index.pop(path, 0)
+            self._index[path] = size
+            over = self.max_bytes is not None and self._total > self.max_bytes
+        if over:
+            self.evict()
+
+    def call(self, service, func, *args, **kwargs):
+        """
+        Return func(*args, **kwargs), served from the cache when possible. The key
+        is built from service, func's name and the normalized arguments.
+        """
+        key = cache_key(service, getattr(func, '__name__', repr(func)), args, kwargs)
+        found, value = self.get(key)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if found:
+            return value
+        value = func(*args, **kwargs)
+        self.put(key, value, service=service)
+        return value
+
+    def wrap(self, service, func):
+        """Cached version of func."""
+        def cached(*args, **kwargs):
+            return self.call(service, func, *args, **kwargs)
+        cached.__name__ = getattr(func, '__name__', 'cached')
+        cached.__doc__ = getattr(func, '__doc__', None)
+        return cached
+
+    def _entries(self):
+        """List of (last_used, size, path) for every entry on disk (a full directory scan)."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.pkl'):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def size_bytes(self):
+        """Total size of the cached entries, from the in-memory index."""
+        return self._total
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            while self._index and self._total > self.max_bytes:
+                path, size = self._index.popitem(last=False)
+                self._total -= size
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._entries():
+                os.remove(path)
+            self._index.clear()
+            self._total = 0
+
+    def stats(self):
+        """Dictionary of hit/miss counts, hit rate and bytes saved/written/on disk."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else np.nan,
+            'bytes_saved': self.bytes_saved,
+            'bytes_written': self.bytes_written,
+            'bytes_on_disk': self.size_bytes(),
+        }
+
+    def report(self):
+        s = self.stats()
+        print(f"Query cache: {s['hits']} hits, {s['misses']} misses (hit rate {s['hit_rate']:.1%}), "
+              f"{s['bytes_saved'] / 1e6:.1f} MB served from disk, {s['bytes_on_disk'] / 1e6:.1f} MB cached")
+
+
+class CachedService:
+    """
+    Proxy for an astroquery service (class or instance) whose query_* methods are
+    served through a ResponseCache. Other attributes pass through unchanged.
+    """
+
+    def __init__(self, service, name, cache):
+        self._service = service
+        self._name = name
+        self._cache = cache
+
+    def __getattr__(self, attr):
+        value = getattr(self._service, attr)
+        if attr.startswith('query') and callable(value):
+            return self._cache.wrap(self._name, value)
+        return value
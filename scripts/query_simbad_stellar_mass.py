@@ -3,15 +3,26 @@ lens_stellar_mass_sdss_query.py
 
 Queries SDSS photometric data in tiled 20 arcmin radius fields around strong gravitational lenses 
 from the lenscat catalog. Estimates stellar mass assuming SDSS 'type' classification and computes 
-stellar mass surface density within the 20 arcmin radius.
+stellar mass surface density within the 20 arcmin radius, plus a cumulative radial
+profile (mass, galaxy count and surface density within each of APERTURES_ARCMIN)
+computed from the same field fetch (see radial_profile.py).
 
 This version excludes the unused low/medium/high density categories from earlier drafts.
 
 Outputs:
-- Incremental CSV progress saved locally (adjust SAVE_DIR path as needed)
+- Append-only JSONL progress log, one record per lens (see progress_log.py). A
+  restarted run resumes from it: lenses already done with the same inputs and
+  RUN_PARAMS are skipped and failed ones are retried (see run_state.py)
+- Final results table compacted from the log at the end: typed Parquet by default
+  (see results_store.py), or CSV if RESULTS_FILE ends in .csv
+- Adjust SAVE_DIR path as needed
 
 Usage:
 - Requires: lenscat, astroquery, astropy, pandas, numpy
+- Field fetching lives in sdss_fetch.py (same directory). Set FETCH_MODE below to
+  'radial' for one SQL query per lens or 'batched' for many lenses per query; in
+  'tiled' mode tune MAX_IN_FLIGHT and REQUESTS_PER_SECOND to trade speed against
+  load on the SDSS server.
 - Run in any Python environment with internet access.
 - For Google Colab users: mount your Google Drive and set SAVE_DIR accordingly.
 
@@ -20,15 +31,19 @@ Date: 2025-07-26
 """
 
 import os
-import time
+from functools import partial
 import numpy as np
 import pandas as pd
 from lenscat import catalog
 from astroquery.sdss import SDSS
-from astropy.coordinates import SkyCoord, Angle
-from astropy.table import vstack, Table
-import astropy.units as u
-from astropy.cosmology import Planck18 as cosmo
+from astropy.coordinates import SkyCoord
+
+from radial_profile import radial_profile, profile_record
+from results_store import LENS_RUN_SCHEMA, normalize_lens_table, write_results
+from run_state import RunState
+from query_cache import ResponseCache, CachedService
+from sdss_fetch import fetch_errors, iter_sdss_fields, sdss_region_query, sdss_sql_query
+from surface_density import surface_mass_density
 
 # === USER CONFIGURATION ===
 # Change this to your desired local or mounted directory path for saving results:
@@ -36,67 +51,65 @@ SAVE_DIR = './lens_stellar_mass_results'
 os.makedirs(SAVE_DIR, exist_ok=True)
 print(f"Results will be saved to: {SAVE_DIR}")
 
-def query_sdss_tiled(center_coord, total_radius_deg=20/60, tile_radius_arcmin=3.0):
-    """
-    Query SDSS in tiled patches within total_radius_deg around center_coord.
-    Tiles are square grid steps with tile_radius_arcmin radius circles overlapping.
-
-    Returns astropy Table of combined photometric objects within total radius.
-    """
-    tile_radius_deg = tile_radius_arcmin / 60.0
-    n_tiles_side = int(np.ceil((2 * total_radius_deg) / tile_radius_deg))
-    all_results = []
-
-    ra_offsets = np.linspace(-total_radius_deg, total_radius_deg, n_tiles_side)
-    dec_offsets = np.linspace(-total_radius_deg, total_radius_deg, n_tiles_side)
-
-    for ra_off in ra_offsets:
-        for dec_off in dec_offsets:
-            tile_center = SkyCoord(ra=center_coord.ra.deg + ra_off,
-                                   dec=center_coord.dec.deg + dec_off,
-                                   unit='deg')
-            try:
-                result = SDSS.query_region(
-                    tile_center,
-                    radius=Angle(tile_radius_arcmin, u.arcmin),
-                    spectro=False,
-                    photoobj_fields=['ra', 'dec', 'type']
-                )
-                if result is not None and len(result) > 0:
-                    all_results.append(result)
-            except Exception as e:
-                print(f"Error querying tile at RA={tile_center.ra.deg:.4f}, DEC={tile_center.dec.deg:.4f}: {e}")
-            time.sleep(0.5)  # polite delay to avoid hammering server
-
-    if all_results:
-        combined = vstack(all_results)
-        coords_all = SkyCoord(ra=combined['ra'], dec=combined['dec'], unit='deg')
-        mask = coords_all.separation(center_coord) <= Angle(total_radius_deg, u.deg)
-        return combined[mask]
-    else:
-        # Return empty table with expected columns if no results
-        return Table(names=['ra', 'dec', 'type'], dtype=[float, float, int])
+# Per-lens results are appended to PROGRESS_LOG and compacted into RESULTS_FILE
+# (.csv or .parquet, in catalog order) once at the end; fsync runs every FSYNC_EVERY lenses.
+PROGRESS_LOG = os.path.join(SAVE_DIR, 'lens_stellar_mass_progress.jsonl')
+RESULTS_FILE = os.path.join(SAVE_DIR, 'lens_stellar_mass.parquet')
+FSYNC_EVERY = 25
+
+# Parameters that determine each lens's result. Lenses logged as done under the same
+# parameters (and the same lens position and redshift) are skipped on a restart;
+# changing any of them re-runs every lens.
+# Each field is fetched once at the largest aperture; the headline total_mass_Msun and
+# mass_surface_density_Msun_per_Mpc2 columns are for that aperture, and every aperture
+# gets its own total_mass_Msun_r<R>arcmin, n_galaxies_r<R>arcmin and
+# mass_surface_density_Msun_per_Mpc2_r<R>arcmin columns.
+APERTURES_ARCMIN = [0.5, 3, 5, 10, 20]
+FIELD_RADIUS_DEG = max(APERTURES_ARCMIN) / 60
+RUN_PARAMS = {'field_radius_deg': FIELD_RADIUS_DEG, 'apertures_arcmin': sorted(APERTURES_ARCMIN),
+              'galaxy_type': 6, 'mass_per_galaxy_Msun': 5e10, 'cosmology': 'Planck18'}
+
+# Field fetch mode: 'tiled' (overlapping 3 arcmin cone queries), 'radial'
+# (one server-side SQL query per lens field) or 'batched' (many lens fields per query)
+FETCH_MODE = 'tiled'
+
+# Concurrent tile fetching: maximum simultaneous SDSS requests and sustained request rate
+MAX_IN_FLIGHT = 4
+REQUESTS_PER_SECOND = 2.0
+
+# Batched mode: lens fields in the first query (later batches adapt to the row limit)
+LENSES_PER_QUERY = 25
+
+# On-disk cache of SDSS responses: re-runs only go to the network for new queries
+CACHE_DIR = os.path.join(SAVE_DIR, 'query_cache')
+CACHE_TTL_DAYS = 90
+CACHE_MAX_BYTES = 5e9
+
+cache = ResponseCache(CACHE_DIR, ttl_seconds=CACHE_TTL_DAYS * 86400, max_bytes=CACHE_MAX_BYTES)
+sdss = CachedService(SDSS, 'SDSS', cache)
+
+# Optional local galaxy store (see galaxy_store.py): lens fields it fully covers are
+# read from disk instead of SDSS. Requires healpy.
+GALAXY_STORE_DIR = None
+if GALAXY_STORE_DIR:
+    from galaxy_store import GalaxyStore
+    store = GalaxyStore(GALAXY_STORE_DIR)
+else:
+    store = None
+
+FETCH_OPTIONS = {
+    'tiled': {'max_in_flight': MAX_IN_FLIGHT, 'requests_per_second': REQUESTS_PER_SECOND,
+              'query_func': partial(sdss_region_query, service=sdss)},
+    'radial': {'sql_func': partial(sdss_sql_query, service=sdss)},
+    'batched': {'batch_size': LENSES_PER_QUERY, 'sql_func': partial(sdss_sql_query, service=sdss)},
+}[FETCH_MODE]
 
 def sdss_type_to_mass(sdss_type):
     """
-    Convert SDSS photometric object 'type' to stellar mass estimate.
+    Convert SDSS photometric object 'type' (scalar or array) to stellar mass estimate.
     Assumes type=6 (galaxy) has mass 5e10 Msun, else zero.
     """
-    return 5e10 if sdss_type == 6 else 0
-
-def surface_mass_density(total_mass, redshift, radius_arcmin=20):
-    """
-    Calculate stellar mass surface density in Msun/Mpc^2 within given radius_arcmin
-    using angular diameter distance from redshift (Planck18 cosmology).
-    Returns np.nan if redshift is invalid.
-    """
-    if redshift is None or np.isnan(redshift):
-        return np.nan
-    theta_rad = radius_arcmin * (np.pi / 180) / 60  # convert arcmin to radians
-    d_a = cosmo.angular_diameter_distance(redshift).to(u.Mpc).value
-    radius_mpc = theta_rad * d_a
-    area = np.pi * radius_mpc**2
-    return total_mass / area
+    return np.where(np.asarray(sdss_type) == 6, 5e10, 0.0)
 
 # Load lens catalog and filter valid redshifts
 cat = catalog
@@ -107,9 +120,18 @@ filtered_df = df.dropna(subset=['zlens']).reset_index(drop=True)
 print(f"Total lenses in catalog: {len(df)}")
 print(f"Lenses after filtering valid redshifts: {len(filtered_df)}")
 
-results = []
+state = RunState(PROGRESS_LOG, run_params=RUN_PARAMS, fsync_every=FSYNC_EVERY)
+lens_keys = [state.lens_hash(name, ra, dec, z) for name, ra, dec, z in
+             zip(filtered_df['name'], filtered_df['RA'], filtered_df['DEC'], filtered_df['zlens'])]
+todo = state.pending(lens_keys)
+print(f"Lenses already done in {PROGRESS_LOG}: {len(filtered_df) - len(todo)}; to process: {len(todo)}")
+
+center_coords = SkyCoord(ra=filtered_df['RA'].values[todo], dec=filtered_df['DEC'].values[todo], unit='deg')
+fields = iter_sdss_fields(list(center_coords), total_radius_deg=FIELD_RADIUS_DEG, mode=FETCH_MODE,
+                          store=store, **FETCH_OPTIONS)
 
-for i, lens in filtered_df.iterrows():
+for n, (i, galaxies) in enumerate(zip(todo, fields)):
+    lens = filtered_df.iloc[i]
     lens_id = lens['name']
     ra = lens['RA']
     dec = lens['DEC']
@@ -117,28 +139,45 @@ for i, lens in filtered_df.iterrows():
 
     print(f"Processing lens {i+1}/{len(filtered_df)}: {lens_id} (RA={ra:.4f}, DEC={dec:.4f}, z={z:.3f})")
 
-    center_coord = SkyCoord(ra=ra, dec=dec, unit='deg')
-    galaxies = query_sdss_tiled(center_coord)
-
-    total_mass = sum(sdss_type_to_mass(t) for t in galaxies['type']) if len(galaxies) else 0.0
-    sigma = surface_mass_density(total_mass, z)
-
-    results.append({
+    # An incomplete fetch (failed tiles or queries, truncated responses) would look like an
+    # empty or sparse field; log the lens as failed so the next run retries it
+    errors = fetch_errors(galaxies)
+    if errors:
+        print(f"Incomplete field for lens {lens_id} ({len(errors)} fetch errors); marked failed for retry")
+        state.mark_failed(lens_keys[i], '; '.join(errors))
+        continue
+
+    try:
+        masses = sdss_type_to_mass(galaxies['type']) if len(galaxies) else np.zeros(0)
+        profile_mass, profile_counts = radial_profile(galaxies['ra'], galaxies['dec'], ra, dec,
+                                                      masses, APERTURES_ARCMIN)
+        total_mass = float(masses.sum())
+        sigma = surface_mass_density(total_mass, z, radius_arcmin=FIELD_RADIUS_DEG * 60)
+        profile = profile_record(profile_mass, profile_counts, z, APERTURES_ARCMIN)
+    except Exception as e:
+        print(f"Error processing lens {lens_id}: {e}")
+        state.mark_failed(lens_keys[i], e)
+        continue
+
+    # Append this lens to the progress log (no rewrite of earlier results)
+    state.mark_done(lens_keys[i], {
         'lens_id': lens_id,
         'ra': ra,
         'dec': dec,
         'redshift': z,
         'total_mass_Msun': total_mass,
-        'mass_surface_density_Msun_per_Mpc2': sigma
+        'mass_surface_density_Msun_per_Mpc2': sigma,
+        **profile
     })
 
-    # Save incremental results after each lens processed
-    results_df = pd.DataFrame(results)
-    save_path = os.path.join(SAVE_DIR, 'lens_stellar_mass_progress.csv')
-    results_df.to_csv(save_path, index=False)
-
-    if (i + 1) % 25 == 0 or (i + 1) == len(filtered_df):
-        print(f"-- Progress: {i+1}/{len(filtered_df)} lenses --")
-        print(f"Results saved to: {save_path}")
-
-print("All done! Final results saved to:", save_path)
+    if (n + 1) % 25 == 0 or (n + 1) == len(todo):
+        print(f"-- Progress: {n+1}/{len(todo)} lenses this run --")
+        print(f"Results logged to: {PROGRESS_LOG}")
+
+state.close()
+print(f"Run state: {state.summary(lens_keys)}")
+# Fill surface_density_Msun_per_kpc2 from the Mpc^2 column before writing
+results_df = normalize_lens_table(state.results(lens_keys))
+write_results(results_df, RESULTS_FILE, LENS_RUN_SCHEMA)
+cache.report()
+print(f"All done! {len(results_df)} results saved to:", RESULTS_FILE)
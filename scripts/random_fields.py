@@ -0,0 +1,85 @@
+"""
+random_fields.py
+
+Vectorized, seeded generation of random control points for the random-field
+(control) sample.
+
+Candidates are drawn in large blocks uniformly on the sphere (RA uniform, sin(dec)
+uniform) inside a footprint given either as RA/Dec boxes, chosen in proportion to their
+true solid angle, or as a HEALPix Footprint (footprint.py). An optional contains(ra, dec) mask refines the footprint, and
+candidates within the exclusion radius of any exclusion-catalog entry (e.g. known
+lenses) are rejected with one KD-tree query per block (see sky_index.py). Blocks
+are sized from the running acceptance rate, and only the first n_points accepted
+candidates are kept, so results are reproducible from the seed.
+
+Usage:
+    ra, dec = sample_random_points(912, STRIPE82_BOXES, lens_ra, lens_dec,
+                                   exclusion_radius_deg=5/60, seed=42)
+    ra, dec = sample_random_points(912, Footprint.load('dr_footprint.npy') - star_mask, ...)
+"""
+
+import numpy as np
+
+from footprint import STRIPE82_BOXES, Footprint, ra_width
+from sky_index import SkyTree
+
+
+def box_solid_angle(ra_min, ra_max, dec_min, dec_max):
+    """Solid angle (sr) of an RA/Dec box."""
+    return np.radians(ra_width(ra_min, ra_max)) * (np.sin(np.radians(dec_max)) - np.sin(np.radians(dec_min)))
+
+
+def sample_boxes(n, boxes, rng):
+    """n points uniform on the sphere within the union of (non-overlapping) boxes."""
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    weights = box_solid_angle(*boxes.T)
+    which = rng.choice(len(boxes), size=n, p=weights / weights.sum())
+    ra_min, ra_max, dec_min, dec_max = boxes[which].T
+    ra = (ra_min + rng.uniform(0, 1, n) * ra_width(ra_min, ra_max)) % 360.0
+    sin_lo, sin_hi = np.sin(np.radians(dec_min)), np.sin(np.radians(dec_max))
+    dec = np.degrees(np.arcsin(sin_lo + rng.uniform(0, 1, n) * (sin_hi - sin_lo)))
+    return ra, dec
+
+
+def sample_random_points(n_points, footprint, exclude_ra=None, exclude_dec=None, exclusion_radius_deg=0.0,
+                         contains=None, seed=None, max_candidates=None):
+    """
+    Draw n_points random positions uniformly within footprint (a list of RA/Dec
+    boxes or a Footprint), optionally refined by a contains(ra, dec) -> bool mask,
+    and further than exclusion_radius_deg from every exclusion-catalog position.
+
+    Returns (ra, dec) arrays in degrees. If max_candidates (default 100 per point)
+    are exhausted first, a warning is printed and fewer points are returned.
+    """
+    rng = np.random.default_rng(seed)
+    max_candidates = max_candidates or 100 * n_points
+    tree = None
+    if exclude_ra is not None and len(exclude_ra) > 0 and exclusion_radius_deg > 0:
+        tree = SkyTree(exclude_ra, exclude_dec)
+
+    ra_parts, dec_parts = [], []
+    n_accepted, n_drawn = 0, 0
+    acceptance = 1.0
+    while n_accepted < n_points and n_drawn < max_candidates:
+        remaining = n_points - n_accepted
+        block = int(min(max_candidates - n_drawn, np.ceil(1.2 * remaining / max(acceptance, 1e-3)) + 64))
+        if isinstance(footprint, Footprint):
+            ra, dec = footprint.sample(block, rng)
+        else:
+            ra, dec = sample_boxes(block, footprint, rng)
+        keep = np.ones(block, dtype=bool)
+        if contains is not None:
+            keep &= np.asarray(contains(ra, dec), dtype=bool)
+        if tree is not None:
+            nearest, _ = tree.nearest_within(ra[keep], dec[keep], exclusion_radius_deg)
+            keep[keep] = nearest < 0
+        n_drawn += block
+        ra_parts.append(ra[keep][:remaining])
+        dec_parts.append(dec[keep][:remaining])
+        n_accepted += len(ra_parts[-1])
+        acceptance = max(n_accepted, 1) / n_drawn
+
+    if n_accepted < n_points:
+        print(f"Warning: Only generated {n_accepted} random points after {n_drawn} candidates. "
+              "Consider increasing max_candidates or reducing the exclusion radius.")
+    return np.concatenate(ra_parts), np.concatenate(dec_parts)
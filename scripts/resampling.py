@@ -0,0 +1,182 @@
+"""
+resampling.py
+
+Bootstrap confidence intervals and permutation p-values for the lens vs random
+comparison of stellar mass surface densities.
+
+A single K-S or Mann-Whitney p-value says nothing about the uncertainty of the
+effect size (e.g. "the lens mean is ~10x the random mean"). This module runs tens
+of thousands of resampling replicates of the two-sample comparison:
+
+- bootstrap: lens and random samples are resampled independently with
+  replacement; each replicate gives the lens/random ratio of the mean and of the
+  median, and percentile intervals of those replicates are the confidence intervals;
+- permutation: the lens/random labels of the pooled sample are shuffled; the
+  p-value of each ratio is the fraction of shuffles whose log-ratio is at least as
+  far from zero as the observed one (two-sided, (1 + hits) / (1 + n) so it is never 0).
+
+Replicates are drawn as index matrices (one row per replicate) and reduced along
+rows with numpy, a chunk of replicates at a time. The chunk size is derived from
+memory_bytes: each replicate holds an int64 index, the gathered float64 value and
+the median's working copy for every lens and random value (BYTES_PER_VALUE), so a
+chunk of memory_bytes // (BYTES_PER_VALUE * (n_lens + n_random)) replicates (at
+least one) stays within the budget whatever the sample sizes. Chunks can run on a
+process pool (max_workers > 1), each within the budget. Every chunk has its own
+random generator spawned from the seed, so results depend only on the seed and the
+chunk size (fixed by memory_bytes and the sample sizes), not on the number of workers.
+
+Usage:
+    from resampling import compare_samples, format_summary
+    summary = compare_samples(lens_sigma, random_sigma, n_bootstrap=20000,
+                              n_permutations=20000, seed=42, max_workers=4)
+    print(format_summary(summary))
+
+Requires: numpy
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+STATISTICS = ('mean', 'median')
+
+DEFAULT_MEMORY_BYTES = 256 * 2**20  # per chunk of replicates
+BYTES_PER_VALUE = 24  # int64 index + gathered float64 + median working copy, per value per replicate
+
+
+def _row_statistic(values, name):
+    """The named statistic of each row of a 2-D array."""
+    if name == 'mean':
+        return values.mean(axis=1)
+    if name == 'median':
+        return np.median(values, axis=1)
+    raise ValueError(f"Unknown statistic {name!r}; expected one of {STATISTICS}")
+
+
+def replicates_per_chunk(n_values, memory_bytes=DEFAULT_MEMORY_BYTES):
+    """Replicates per chunk that keep a chunk over n_values sample values within memory_bytes."""
+    return max(1, int(memory_bytes // (BYTES_PER_VALUE * max(1, n_values))))
+
+
+def _chunk_sizes(n_replicates, chunk_size):
+    """Replicates per chunk: full chunks of chunk_size and a final partial one."""
+    sizes = [chunk_size] * (n_replicates // chunk_size)
+    if n_replicates % chunk_size:
+        sizes.append(n_replicates % chunk_size)
+    return sizes
+
+
+def _bootstrap_chunk(lens, random, size, seed_seq, statistics):
+    """Lens/random statistic ratios of size bootstrap replicates, one array per statistic."""
+    rng = np.random.default_rng(seed_seq)
+    # Index matrices are gathered and released at once, so only the values are held while reducing
+    lens_rows = lens[rng.integers(0, len(lens), size=(size, len(lens)))]
+    random_rows = random[rng.integers(0, len(random), size=(size, len(random)))]
+    return {name: _row_statistic(lens_rows, name) / _row_statistic(random_rows, name) for name in statistics}
+
+
+def _permutation_chunk(pooled, n_lens, size, seed_seq, statistics):
+    """Lens/random statistic ratios of size label permutations of the pooled sample."""
+    rng = np.random.default_rng(seed_seq)
+    rows = pooled[rng.permuted(np.broadcast_to(np.arange(len(pooled)), (size, len(pooled))), axis=1)]
+    lens_rows, random_rows = rows[:, :n_lens], rows[:, n_lens:]
+    return {name: _row_statistic(lens_rows, name) / _row_statistic(random_rows, name) for name in statistics}
+
+
+def _run_chunks(func, args, n_replicates, chunk_size, seed, max_workers, statistics):
+    """Run func over all chunks (in process or on a pool) and concatenate the replicates."""
+    sizes = _chunk_sizes(n_replicates, chunk_size)
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    seeds = root.spawn(len(sizes))
+    jobs = [(*args, size, seed_seq, statistics) for size, seed_seq in zip(sizes, seeds)]
+    if max_workers and max_workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            parts = list(pool.map(func, *zip(*jobs)))
+    else:
+        parts = [func(*job) for job in jobs]
+    if not parts:
+        return {name: np.empty(0) for name in statistics}
+    return {name: np.concatenate([part[name] for part in parts]) for name in statistics}
+
+
+def _as_sample(values, label):
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        raise ValueError(f"The {label} sample has no finite values")
+    return values
+
+
+def bootstrap_ratios(lens, random, n_bootstrap=20000, statistics=STATISTICS, seed=None,
+                     memory_bytes=DEFAULT_MEMORY_BYTES, max_workers=1):
+    """
+    Bootstrap replicates of the lens/random ratio of each statistic ('mean',
+    'median'). Returns {statistic: array of n_bootstrap ratios}.
+    """
+    lens, random = _as_sample(lens, 'lens'), _as_sample(random, 'random')
+    chunk_size = replicates_per_chunk(len(lens) + len(random), memory_bytes)
+    return _run_chunks(_bootstrap_chunk, (lens, random), n_bootstrap, chunk_size,
+                       seed, max_workers, statistics)
+
+
+def permutation_ratios(lens, random, n_permutations=20000, statistics=STATISTICS, seed=None,
+                       memory_bytes=DEFAULT_MEMORY_BYTES, max_workers=1):
+    """
+    Lens/random ratios of each statistic under random relabelling of the pooled
+    sample (the null distribution). Returns {statistic: array of n_permutations ratios}.
+    """
+    lens, random = _as_sample(lens, 'lens'), _as_sample(random, 'random')
+    pooled = np.concatenate([lens, random])
+    chunk_size = replicates_per_chunk(len(pooled), memory_bytes)
+    return _run_chunks(_permutation_chunk, (pooled, len(lens)), n_permutations, chunk_size,
+                       seed, max_workers, statistics)
+
+
+def permutation_p_value(observed_ratio, null_ratios):
+    """Two-sided permutation p-value of a ratio, comparing |log ratio| to the null replicates."""
+    observed = abs(np.log(observed_ratio))
+    hits = np.count_nonzero(np.abs(np.log(null_ratios)) >= observed * (1 - 1e-12))
+    return (1 + hits) / (1 + len(null_ratios))
+
+
+def compare_samples(lens, random, n_bootstrap=20000, n_permutations=20000, confidence=0.95,
+                    statistics=STATISTICS, seed=None, memory_bytes=DEFAULT_MEMORY_BYTES, max_workers=1):
+    """
+    Observed lens/random ratio, bootstrap percentile confidence interval and
+    permutation p-value of each statistic. Returns
+    {statistic: {'ratio', 'ci_low', 'ci_high', 'p_value', 'lens', 'random'}} plus
+    the run settings under 'settings'. Bootstrap and permutation replicates use
+    independent streams spawned from seed.
+    """
+    lens, random = _as_sample(lens, 'lens'), _as_sample(random, 'random')
+    boot_seed, perm_seed = np.random.SeedSequence(seed).spawn(2)
+    boot = bootstrap_ratios(lens, random, n_bootstrap, statistics, boot_seed, memory_bytes, max_workers)
+    null = permutation_ratios(lens, random, n_permutations, statistics, perm_seed, memory_bytes, max_workers)
+
+    alpha = 1 - confidence
+    summary = {'settings': {'n_lens': len(lens), 'n_random': len(random), 'n_bootstrap': n_bootstrap,
+                            'n_permutations': n_permutations, 'confidence': confidence, 'seed': seed}}
+    for name in statistics:
+        lens_stat = _row_statistic(lens[None, :], name)[0]
+        random_stat = _row_statistic(random[None, :], name)[0]
+        ratio = lens_stat / random_stat
+        ci_low, ci_high = np.quantile(boot[name], [alpha / 2, 1 - alpha / 2]) if n_bootstrap else (np.nan, np.nan)
+        summary[name] = {'lens': lens_stat, 'random': random_stat, 'ratio': ratio,
+                         'ci_low': ci_low, 'ci_high': ci_high,
+                         'p_value': permutation_p_value(ratio, null[name]) if n_permutations else np.nan}
+    return summary
+
+
+def format_summary(summary):
+    """Printable report of a compare_samples() result."""
+    settings = summary['settings']
+    lines = [f"Resampling (N_lens={settings['n_lens']}, N_random={settings['n_random']}, "
+             f"{settings['n_bootstrap']} bootstrap / {settings['n_permutations']} permutation replicates, "
+             f"seed={settings['seed']}):"]
+    for name, result in summary.items():
+        if name == 'settings':
+            continue
+        lines.append(f"  {name.capitalize()} ratio (lens/random): {result['ratio']:.3f} "
+                     f"[{settings['confidence']:.0%} CI {result['ci_low']:.3f} - {result['ci_high']:.3f}], "
+                     f"permutation p = {result['p_value']:.2e}")
+    return '\n'.join(lines)
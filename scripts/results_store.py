@@ -0,0 +1,226 @@
+"""
+results_store.py
+
+Columnar (Parquet/Arrow) storage for lens and random-field results.
+
+The results CSVs are re-parsed as text by every analysis step, and the lens table
+carries the same kpc^2 surface density under two names (surface_density_Msun_per_kpc2
+and surface_density_kpc2, each filled for a different subset of rows). This module
+stores results as Parquet with explicit Arrow schemas:
+
+- normalize_lens_table() merges the duplicated surface density columns into
+  surface_density_Msun_per_kpc2 (filling any remaining gaps from the Mpc^2 column);
+  normalize_random_fields() drops the summary rows (Mean/Median/StdDev) appended
+  to the random-field CSV;
+- write_results() writes typed Parquet (per-column min/max statistics in every row
+  group, class labels dictionary-encoded) or CSV, chosen by file extension;
+- read_results() loads only the requested columns and pushes row filters down to
+  the Parquet reader, so row groups whose statistics exclude the filter are skipped.
+  CSV inputs are still accepted and filtered in pandas;
+- iter_results() yields the requested columns batch by batch (Parquet record
+  batches or CSV chunks), for tables too large to load at once.
+
+Usage:
+    python scripts/results_store.py results/1486combined_lens_stellar_mass_all_2025Jul.csv
+    python scripts/results_store.py results/lens.parquet --csv results/lens_export.csv
+
+    df = read_results('results/1486combined_lens_stellar_mass_all_2025Jul.parquet',
+                      columns=['lens_id', 'mass_surface_density_Msun_per_Mpc2'],
+                      filters=[('mass_surface_density_Msun_per_Mpc2', '>', 0)])
+
+Requires: pyarrow, pandas, numpy
+"""
+
+import argparse
+import operator
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+LENS_SCHEMA = pa.schema([
+    ('lens_id', pa.string()),
+    ('ra', pa.float64()),
+    ('dec', pa.float64()),
+    ('redshift', pa.float64()),
+    ('total_mass_Msun', pa.float64()),
+    ('mass_surface_density_Msun_per_Mpc2', pa.float64()),
+    ('surface_density_Msun_per_kpc2', pa.float64()),
+    ('density_class', pa.dictionary(pa.int8(), pa.string())),
+    ('environment_class', pa.dictionary(pa.int8(), pa.string())),
+])
+
+# Columns written by query_simbad_stellar_mass.py, which does not compute the class labels
+LENS_RUN_SCHEMA = pa.schema([field for field in LENS_SCHEMA
+                             if field.name not in ('density_class', 'environment_class')])
+
+RANDOM_FIELD_SCHEMA = pa.schema([
+    ('Control_Field_ID', pa.int32()),
+    ('Galaxy_Count', pa.float64()),
+])
+
+THRESHOLD_SCHEMA = pa.schema([
+    ('f_star', pa.float64()),
+    ('lenses_below_threshold', pa.int64()),
+    ('percent_below_threshold', pa.float64()),
+])
+
+SWEEP_SCHEMA = pa.schema([
+    ('f_star', pa.float64()),
+    ('cdm_threshold', pa.float64()),
+    ('mass_scale', pa.float64()),
+    ('lenses_below_threshold', pa.int64()),
+    ('percent_below_threshold', pa.float64()),
+])
+
+# Alternative names of the same quantity, merged into the schema name on normalization
+LENS_COLUMN_ALIASES = {'surface_density_kpc2': 'surface_density_Msun_per_kpc2'}
+
+_FILTER_OPS = {'==': operator.eq, '=': operator.eq, '!=': operator.ne, '<': operator.lt,
+               '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+
+def normalize_lens_table(df):
+    """Lens results with duplicated columns merged and the LENS_SCHEMA column set."""
+    df = df.copy()
+    for alias, name in LENS_COLUMN_ALIASES.items():
+        if alias in df.columns:
+            df[name] = df[name].fillna(df[alias]) if name in df.columns else df[alias]
+            df = df.drop(columns=alias)
+    if 'mass_surface_density_Msun_per_Mpc2' in df.columns:
+        per_kpc2 = df['mass_surface_density_Msun_per_Mpc2'] / 1e6
+        df['surface_density_Msun_per_kpc2'] = df.get('surface_density_Msun_per_kpc2', per_kpc2).fillna(per_kpc2)
+    return df
+
+
+def normalize_random_fields(df):
+    """Random-field counts without the summary rows appended after the fields."""
+    ids = pd.to_numeric(df['Control_Field_ID'], errors='coerce')
+    return df[ids.notna()].assign(Control_Field_ID=ids[ids.notna()].astype(np.int32))
+
+
+def detect_schema(df):
+    """The schema of a results table, from its key column (None if unknown)."""
+    if 'lens_id' in df.columns:
+        return LENS_SCHEMA
+    if 'Control_Field_ID' in df.columns:
+        return RANDOM_FIELD_SCHEMA
+    if 'cdm_threshold' in df.columns:
+        return SWEEP_SCHEMA
+    if 'f_star' in df.columns:
+        return THRESHOLD_SCHEMA
+    return None
+
+
+def to_arrow(df, schema=None):
+    """
+    Arrow table of df. With a schema, columns are cast to it and ordered like it
+    (schema columns missing from df are filled with nulls; extra columns are kept
+    after them with inferred types).
+    """
+    if schema is None:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    df = df.reset_index(drop=True)
+    extra = [name for name in df.columns if name not in schema.names]
+    arrays = [pa.array(df[field.name], from_pandas=True).cast(field.type) if field.name in df.columns
+              else pa.nulls(len(df), field.type) for field in schema]
+    table = pa.Table.from_arrays(arrays, schema=schema)
+    for name in extra:
+        table = table.append_column(name, pa.array(df[name], from_pandas=True))
+    return table
+
+
+def write_results(df, path, schema=None, row_group_size=None):
+    """
+    Atomically write df to path as Parquet (typed by schema, with column
+    statistics) or CSV, chosen by the file extension.
+    """
+    tmp_path = path + '.tmp'
+    if path.endswith('.parquet'):
+        pq.write_table(to_arrow(df, schema), tmp_path, row_group_size=row_group_size,
+                       write_statistics=True)
+    elif path.endswith('.csv'):
+        df.to_csv(tmp_path, index=False)
+    else:
+        raise ValueError(f"Unsupported output format for {path}; expected .csv or .parquet")
+    os.replace(tmp_path, path)
+
+
+def _filter_frame(df, filters):
+    """Apply (column, op, value) filters (ANDed) to a DataFrame."""
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        if op == 'in':
+            mask &= df[column].isin(value).to_numpy()
+        elif op == 'not in':
+            mask &= ~df[column].isin(value).to_numpy()
+        else:
+            mask &= _FILTER_OPS[op](df[column], value).fillna(False).to_numpy(dtype=bool)
+    return df[mask].reset_index(drop=True)
+
+
+def result_columns(path):
+    """Column names of a results file without reading its rows."""
+    if path.endswith('.parquet'):
+        return pq.read_schema(path).names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_results(path, columns=None, filters=None):
+    """
+    DataFrame of the given columns (default all) of a results file, keeping rows
+    that pass every (column, op, value) filter; op is one of ==, !=, <, <=, >, >=,
+    in, not in. Parquet files are read with column projection and filter pushdown.
+    """
+    if path.endswith('.parquet'):
+        table = pq.read_table(path, columns=columns, filters=filters or None)
+        return table.to_pandas()
+    usecols = None
+    if columns is not None:
+        usecols = list(dict.fromkeys(list(columns) + [f[0] for f in filters or []]))
+    df = pd.read_csv(path, usecols=usecols)
+    if filters:
+        df = _filter_frame(df, filters)
+    return df[columns] if columns is not None else df
+
+
+def iter_results(path, columns=None, batch_size=65536):
+    """
+    Yield DataFrames of at most batch_size rows with the given columns (default
+    all) of a results file, without loading the whole file.
+    """
+    if path.endswith('.parquet'):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=batch_size)
+
+
+def convert(path, out_path=None):
+    """Normalize a results CSV and write it as typed Parquet next to it. Returns the output path."""
+    df = pd.read_csv(path)
+    schema = detect_schema(df)
+    if schema is LENS_SCHEMA:
+        df = normalize_lens_table(df)
+    elif schema is RANDOM_FIELD_SCHEMA:
+        df = normalize_random_fields(df)
+    out_path = out_path or os.path.splitext(path)[0] + '.parquet'
+    write_results(df, out_path, schema)
+    return out_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert results CSVs to typed Parquet, or export Parquet to CSV.")
+    parser.add_argument('paths', nargs='+', help="results .csv files to convert, or one .parquet file with --csv")
+    parser.add_argument('--csv', help="export the given .parquet file to this CSV path")
+    args = parser.parse_args()
+
+    if args.csv:
+        write_results(read_results(args.paths[0]), args.csv)
+        print(f"Exported {args.paths[0]} to {args.csv}")
+    else:
+        for path in args.paths:
+            out_path = convert(path)
+            print(f"{path} -> {out_path} ({os.path.getsize(path)} -> {os.path.getsize(out_path)} bytes)")
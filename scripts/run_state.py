@@ -0,0 +1,100 @@
+"""
+run_state.py
+
+Resumable per-lens run state for long field-query runs.
+
+RunState keeps the status of every lens (done, failed or pending) in the
+append-only progress log of progress_log.py. Each record carries a content hash
+of everything that determines that lens's result: the lens id and position, its
+redshift and the run parameters (aperture, mass model, ...). On restart:
+
+- lenses with a 'done' record under the current hash are skipped;
+- failed lenses, lenses without a record, and lenses whose inputs or run
+  parameters changed since their record was written (hash mismatch) are pending;
+- results() returns one row per lens in the order of the lens list given, taking
+  the latest record per lens, so the merged output does not depend on which run
+  (or in which order) each lens was completed.
+
+Usage:
+    state = RunState('results/progress.jsonl', run_params={'radius_deg': 20/60})
+    keys = [state.lens_hash(name, ra, dec, z) for name, ra, dec, z in lenses]
+    for i in state.pending(keys):
+        ...
+        state.mark_done(keys[i], {'lens_id': ..., 'total_mass_Msun': ...})
+    state.close()
+    state.compact(keys, 'results/lens_stellar_mass.csv')
+"""
+
+import pandas as pd
+
+from progress_log import ProgressWriter, read_progress
+from query_cache import cache_key
+from results_store import write_results
+
+
+class RunState:
+    """
+    Per-lens done/failed/pending bookkeeping backed by an append-only log.
+    """
+
+    def __init__(self, log_path, run_params=None, fsync_every=25):
+        self.log_path = log_path
+        self.run_params = dict(run_params or {})
+        self.records = {}
+        for record in read_progress(log_path):
+            if 'key' in record:
+                self.records[record['key']] = record
+        self._writer = ProgressWriter(log_path, fsync_every=fsync_every, append=True)
+
+    def lens_hash(self, lens_id, *inputs):
+        """Content hash of one lens's inputs together with the run parameters."""
+        return cache_key('run_state', str(lens_id), inputs, self.run_params)
+
+    def status(self, key):
+        """'done', 'failed' or 'pending' for the lens with hash key."""
+        return self.records.get(key, {}).get('status', 'pending')
+
+    def pending(self, keys):
+        """Indices into keys of the lenses that still have to run, in order."""
+        return [i for i, key in enumerate(keys) if self.status(key) != 'done']
+
+    def summary(self, keys):
+        """Counts of done, failed and pending lenses among keys."""
+        statuses = [self.status(key) for key in keys]
+        return {status: statuses.count(status) for status in ('done', 'failed', 'pending')}
+
+    def _write(self, key, status, **fields):
+        record = {'key': key, 'status': status, **fields}
+        self._writer.write(record)
+        self.records[key] = record
+
+    def mark_done(self, key, result):
+        """Record the result dict of a completed lens."""
+        self._write(key, 'done', result=result)
+
+    def mark_failed(self, key, error, result=None):
+        """Record a failed lens (retried on the next run)."""
+        self._write(key, 'failed', error=str(error), result=result)
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def results(self, keys):
+        """DataFrame of the results of the done lenses among keys, in key order."""
+        rows = [self.records[key]['result'] for key in keys if self.status(key) == 'done']
+        return pd.DataFrame(rows)
+
+    def compact(self, keys, out_path, schema=None):
+        """
+        Write results(keys) to out_path (.csv or .parquet, typed by schema; see
+        results_store.py). Returns the DataFrame.
+        """
+        df = self.results(keys)
+        write_results(df, out_path, schema)
+        return df
@@ -0,0 +1,146 @@
+"""
+sample_loader.py
+
+Lens and random-field stellar mass surface density samples for the statistical
+comparison in analyze_stellar_mass.py, read from the results tables.
+
+- load_lens_sample() streams the lens results (Parquet or CSV, see
+  results_store.py) and returns surface_density_Msun_per_kpc2, with the duplicated
+  CSV columns merged by normalize_lens_table();
+- load_random_sample() streams Control_Field_ID / Galaxy_Count from the
+  random-field table (summary rows dropped) and converts galaxy counts to surface
+  densities, either with a fixed density per galaxy or from the per-galaxy mass,
+  aperture and a reference redshift;
+- fields with no galaxies (total_mass_Msun or Galaxy_Count == 0, about 40% of the
+  lens table) are counted and, with zero_galaxy='drop' (default), left out of the
+  sample; 'keep' keeps them as zeros and 'raise' treats them as an error. Rows
+  without a finite surface density (e.g. missing redshift) are always left out
+  and counted;
+- synthetic_samples() draws log-normal samples matching the published summary
+  statistics, as a fixture for benchmarks and for running without the results.
+
+Usage:
+    lens = load_lens_sample('results/1486combined_lens_stellar_mass_all_2025Jul.parquet')
+    random = load_random_sample('results/stellar_density_random_fields.parquet')
+    print(lens.n_rows, lens.n_zero, len(lens.values))
+
+Requires: pandas, numpy (pyarrow for Parquet inputs)
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from results_store import iter_results, normalize_lens_table, normalize_random_fields, result_columns
+from surface_density import surface_mass_density_array
+
+# values: finite surface densities (Msun/kpc^2); n_rows: rows read;
+# n_zero: zero-galaxy rows; n_invalid: rows without a finite surface density
+Sample = namedtuple('Sample', ['values', 'n_rows', 'n_zero', 'n_invalid'])
+
+SIGMA_COLUMN = 'surface_density_Msun_per_kpc2'
+LENS_INPUT_COLUMNS = ['total_mass_Msun', 'mass_surface_density_Msun_per_Mpc2',
+                      'surface_density_Msun_per_kpc2', 'surface_density_kpc2']
+ZERO_GALAXY_MODES = ('drop', 'keep', 'raise')
+
+# Density per galaxy (Msun/kpc^2) behind the published random-field comparison:
+# mean Sigma_star 1.03e6 Msun/kpc^2 for a mean of 86.07 galaxies per field.
+RANDOM_SIGMA_PER_GALAXY = 1.03e6 / 86.07
+
+# Summary statistics (Msun/kpc^2) the synthetic fixture samples are drawn to match
+SYNTHETIC_LENS_STATS = {'mean': 9.97e6, 'std': 3.26e7}
+SYNTHETIC_RANDOM_STATS = {'mean': 1.03e6, 'std': 9.76e4}
+
+
+def _finish(values, zero, n_rows, zero_galaxy, label):
+    """Apply the zero-galaxy policy and drop non-finite values."""
+    if zero_galaxy not in ZERO_GALAXY_MODES:
+        raise ValueError(f"zero_galaxy must be one of {ZERO_GALAXY_MODES}, got {zero_galaxy!r}")
+    values = np.concatenate(values) if values else np.empty(0)
+    zero = np.concatenate(zero) if zero else np.empty(0, dtype=bool)
+    n_zero = int(np.count_nonzero(zero))
+    if n_zero and zero_galaxy == 'raise':
+        raise ValueError(f"{n_zero} {label} fields have no galaxies")
+    keep = np.isfinite(values)
+    n_invalid = int(np.count_nonzero(~keep))
+    if zero_galaxy == 'drop':
+        keep &= ~zero
+    return Sample(values[keep], n_rows, n_zero, n_invalid)
+
+
+def load_lens_sample(path, zero_galaxy='drop', batch_size=65536):
+    """Sample of lens surface densities (Msun/kpc^2) from a lens results table."""
+    columns = [name for name in LENS_INPUT_COLUMNS if name in result_columns(path)]
+    values, zero, n_rows = [], [], 0
+    for batch in iter_results(path, columns=columns, batch_size=batch_size):
+        batch = normalize_lens_table(batch)
+        if SIGMA_COLUMN not in batch.columns:
+            raise ValueError(f"{path} has no surface density column")
+        sigma = batch[SIGMA_COLUMN].to_numpy(dtype=float)
+        mass = batch['total_mass_Msun'].to_numpy(dtype=float) if 'total_mass_Msun' in batch.columns else sigma
+        values.append(sigma)
+        zero.append(mass == 0)
+        n_rows += len(batch)
+    return _finish(values, zero, n_rows, zero_galaxy, 'lens')
+
+
+def counts_to_surface_density(counts, sigma_per_galaxy=RANDOM_SIGMA_PER_GALAXY, redshift=None,
+                              mass_per_galaxy=5e10, radius_arcmin=20):
+    """
+    Surface densities (Msun/kpc^2) of fields with the given galaxy counts. With a
+    redshift, each galaxy of mass_per_galaxy counts over the area of radius_arcmin
+    at that redshift (Planck18); otherwise sigma_per_galaxy is used.
+    """
+    counts = np.asarray(counts, dtype=float)
+    if redshift is not None:
+        sigma_per_galaxy = surface_mass_density_array(mass_per_galaxy, redshift, radius_arcmin) / 1e6
+    return counts * sigma_per_galaxy
+
+
+def load_random_sample(path, zero_galaxy='drop', batch_size=65536, **conversion):
+    """
+    Sample of random-field surface densities (Msun/kpc^2) from a random-field
+    table; conversion is passed on to counts_to_surface_density().
+    """
+    values, zero, n_rows = [], [], 0
+    for batch in iter_results(path, columns=['Control_Field_ID', 'Galaxy_Count'], batch_size=batch_size):
+        batch = normalize_random_fields(batch)
+        counts = batch['Galaxy_Count'].to_numpy(dtype=float)
+        values.append(counts_to_surface_density(counts, **conversion))
+        zero.append(counts == 0)
+        n_rows += len(batch)
+    return _finish(values, zero, n_rows, zero_galaxy, 'random')
+
+
+def estimate_lognorm_params(mean, std_dev):
+    """
+    Estimates the shape (s) and scale (scale) parameters for a log-normal distribution
+    given its arithmetic mean and standard deviation.
+    The location (loc) parameter is assumed to be 0.
+    """
+    # Handle cases where mean is non-positive or std_dev is negative, which would lead to errors
+    if mean <= 0 or std_dev < 0:
+        print(f"Warning: Invalid input for log-normal parameter estimation (mean={mean}, std_dev={std_dev}). "
+              "Returning default parameters.")
+        return 1.0, 0.0, 1.0
+
+    # sigma^2 = ln(1 + (std_dev/mean)^2), mu = ln(mean) - sigma^2/2
+    sigma_sq = np.log(1 + (std_dev**2 / (mean**2)))
+    mu = np.log(mean) - sigma_sq / 2
+    return np.sqrt(sigma_sq), 0, np.exp(mu)
+
+
+def synthetic_sample(mean, std_dev, n, rng):
+    """n log-normal draws with the given arithmetic mean and standard deviation."""
+    s, _, scale = estimate_lognorm_params(mean, std_dev)
+    values = rng.lognormal(mean=np.log(scale), sigma=s, size=n)
+    values[values <= 0] = np.finfo(float).eps
+    return values
+
+
+def synthetic_samples(n=912, seed=None, lens_stats=SYNTHETIC_LENS_STATS, random_stats=SYNTHETIC_RANDOM_STATS):
+    """Synthetic (lens, random) Samples of n values each, matching the given summary statistics."""
+    rng = np.random.default_rng(seed)
+    lens = synthetic_sample(lens_stats['mean'], lens_stats['std'], n, rng)
+    random = synthetic_sample(random_stats['mean'], random_stats['std'], n, rng)
+    return Sample(lens, n, 0, 0), Sample(random, n, 0, 0)
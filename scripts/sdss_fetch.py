@@ -0,0 +1,431 @@
+"""
+sdss_fetch.py
+
+Fetch engines for SDSS photometric queries around strong lens fields.
+
+Three fetch modes are available, selected through query_sdss_field(mode=...):
+
+- 'tiled':  query_sdss_tiled() covers a circular field with overlapping cone queries
+            laid out by tile_planner.py. Tiles are fetched concurrently on a thread
+            pool with a bounded number of requests in flight, and a token-bucket
+            rate limiter replaces the fixed per-tile sleep of earlier drafts.
+            iter_sdss_tiled() streams the same deduplicated rows tile by tile.
+- 'radial': query_sdss_radial() sends a single SQL query per field using the
+            server-side fGetNearbyObjAllEq() function, so one request replaces the
+            whole tile grid. Like the tiled cone searches (SDSS.query_region, which
+            runs with photoScope='allObj'), it searches all photometric objects
+            (PhotoObjAll), not only primary ones, so every mode sees the same objects.
+- 'batched': iter_sdss_fields_batched() packs many lens fields into one UNION ALL
+            query, tags rows with the field index and splits them client-side.
+            The batch size adapts to the SkyServer response-size limit.
+
+iter_sdss_fields() walks a list of field centres in any mode and yields one Table
+per field, in input order. A field whose fetch was incomplete (a failed tile or
+query, or a response that may be truncated by the row limit) still yields a Table,
+with the problems listed in table.meta['fetch_errors']; fetch_errors(table)
+returns them, so callers can record the field as failed instead of empty. Passing store=GalaxyStore(...) (see galaxy_store.py)
+serves every field already ingested locally without touching the network.
+
+The query functions are injectable (query_func / sql_func), so every mode can be run
+against a local fake endpoint (see fake_sdss.py) without network access.
+
+Usage:
+    from sdss_fetch import query_sdss_field, iter_sdss_fields
+    galaxies = query_sdss_field(center_coord, mode='radial')
+    for galaxies in iter_sdss_fields(center_coords, mode='batched'):
+        ...
+
+Requires: astroquery, astropy, numpy
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.coordinates import SkyCoord, Angle
+from astropy.table import Table, vstack
+import astropy.units as u
+
+from galaxy_stream import dedup_stream
+from tile_planner import plan_hex_tiles, plan_square_tiles
+
+DEFAULT_PHOTOOBJ_FIELDS = ('objID', 'ra', 'dec', 'type')
+
+# Server-side cone search over all photometric objects (PhotoObjAll), matching the object
+# scope of SDSS.query_region in the tiled mode; fGetNearbyObjEq would return primary
+# objects only
+NEARBY_FUNCTION = 'fGetNearbyObjAllEq'
+
+# Table.meta key listing the problems of an incomplete field fetch (see fetch_errors)
+FETCH_ERRORS_KEY = 'fetch_errors'
+
+# SkyServer caps SQL responses at this many rows; larger results are silently truncated
+SDSS_MAX_ROWS = 500000
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. Each request
+    takes one token and blocks until one is available, so bursts of up to `capacity`
+    requests go out immediately and the sustained rate never exceeds `rate`.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def empty_field_table():
+    """Empty table with the expected columns, returned when a field has no objects."""
+    return Table(names=['objID', 'ra', 'dec', 'type'], dtype=[np.int64, float, float, int])
+
+
+def _set_fetch_errors(table, errors):
+    """Record the fetch problems of a field (an empty list for a complete fetch) on its Table."""
+    table.meta[FETCH_ERRORS_KEY] = [str(e) for e in errors]
+    return table
+
+
+def fetch_errors(table):
+    """
+    Problems recorded while fetching a field Table (failed tiles or queries,
+    possibly truncated responses); an empty list means the fetch was complete.
+    """
+    return list(table.meta.get(FETCH_ERRORS_KEY, [])) if table is not None else []
+
+
+def clip_to_field(table, center_coord, total_radius_deg):
+    """Keep only the rows of table within total_radius_deg of center_coord."""
+    coords_all = SkyCoord(ra=table['ra'], dec=table['dec'], unit='deg')
+    mask = coords_all.separation(center_coord) <= Angle(total_radius_deg, u.deg)
+    return table[mask]
+
+
+def _store_covers(store, center_coord, total_radius_deg):
+    """True if store is given and holds every object of the field."""
+    return store is not None and store.covers(center_coord.ra.deg, center_coord.dec.deg, total_radius_deg)
+
+
+def sdss_region_query(tile_center, radius, photoobj_fields=DEFAULT_PHOTOOBJ_FIELDS, service=None):
+    """
+    Default per-tile query: SDSS photometric cone search around tile_center.
+    service replaces astroquery's SDSS, e.g. with a query_cache.CachedService.
+    """
+    if service is None:
+        from astroquery.sdss import SDSS as service
+    return service.query_region(
+        tile_center,
+        radius=radius,
+        spectro=False,
+        photoobj_fields=list(photoobj_fields)
+    )
+
+
+def iter_tile_results(tile_centers, query_func, max_in_flight=4, rate_limiter=None, failures=None):
+    """
+    Run query_func(tile_center) for every tile on a thread pool and yield the
+    non-empty result Tables in tile order as they become available.
+
+    At most max_in_flight requests are outstanding at any time, and each request
+    first takes a token from rate_limiter (if given). Failed tiles are reported and
+    skipped; pass a list as failures to collect a description of each one.
+    """
+    def _run(tile_center):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return query_func(tile_center)
+        except Exception as e:
+            message = f"Error querying tile at RA={tile_center.ra.deg:.4f}, DEC={tile_center.dec.deg:.4f}: {e}"
+            print(message)
+            if failures is not None:
+                failures.append(message)
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_in_flight))) as pool:
+        for result in pool.map(_run, tile_centers):
+            if result is not None and len(result) > 0:
+                yield result
+
+
+def fetch_tiles(tile_centers, query_func, max_in_flight=4, rate_limiter=None, failures=None):
+    """
+    List of the non-empty result Tables of iter_tile_results(), in tile order.
+    """
+    return list(iter_tile_results(tile_centers, query_func, max_in_flight, rate_limiter, failures))
+
+
+def iter_sdss_tiled(center_coord, total_radius_deg=20/60, tile_radius_arcmin=3.0,
+                    max_in_flight=4, requests_per_second=2.0, query_func=None,
+                    photoobj_fields=DEFAULT_PHOTOOBJ_FIELDS, tiling='hex', store=None, dedup=None,
+                    failures=None):
+    """
+    Stream the objects within total_radius_deg of center_coord tile by tile.
+    Tiles are tile_radius_arcmin radius circles laid out by tile_planner.py:
+    tiling='hex' uses a hexagonal covering clipped to the field, tiling='square'
+    the original square grid.
+
+    Tiles are fetched concurrently with at most max_in_flight requests outstanding,
+    throttled to requests_per_second (None disables throttling). query_func, if given,
+    replaces the SDSS cone search and is called as query_func(tile_center, radius).
+
+    Each tile result is clipped to the field and deduplicated against earlier tiles
+    (on objID, or position when objID is not requested) before it is yielded, so
+    every object appears once across the stream. dedup, if given, is the
+    dedup.StreamingDeduplicator to use (e.g. one shared across fields). If store
+    (a galaxy_store.GalaxyStore) covers the field, the stored rows are yielded
+    as a single batch and no tiles are fetched. Failed tiles are skipped; pass a
+    list as failures to collect them (the stream is then incomplete if it is non-empty).
+    """
+    if _store_covers(store, center_coord, total_radius_deg):
+        yield store.query_field(center_coord.ra.deg, center_coord.dec.deg, total_radius_deg)
+        return
+    radius = Angle(tile_radius_arcmin, u.arcmin)
+    if query_func is None:
+        def tile_query(tile_center):
+            return sdss_region_query(tile_center, radius, photoobj_fields)
+    else:
+        def tile_query(tile_center):
+            return query_func(tile_center, radius)
+
+    limiter = TokenBucket(requests_per_second) if requests_per_second else None
+    if tiling == 'hex':
+        plan = plan_hex_tiles(center_coord, total_radius_deg, tile_radius_arcmin)
+    elif tiling == 'square':
+        plan = plan_square_tiles(center_coord, total_radius_deg, tile_radius_arcmin)
+    else:
+        raise ValueError(f"Unknown tiling {tiling!r}; expected 'hex' or 'square'")
+    tiles = list(plan.centers)
+    tile_results = iter_tile_results(tiles, tile_query, max_in_flight=max_in_flight, rate_limiter=limiter,
+                                     failures=failures)
+    yield from dedup_stream((clip_to_field(result, center_coord, total_radius_deg) for result in tile_results),
+                            dedup)
+
+
+def query_sdss_tiled(center_coord, total_radius_deg=20/60, **kwargs):
+    """
+    Query SDSS in tiled patches within total_radius_deg around center_coord and
+    return one Table of the unique objects in the field. Takes the same keyword
+    arguments as iter_sdss_tiled(), which streams the same rows batch by batch.
+    Failed tiles are listed in the result's fetch_errors().
+    """
+    failures = []
+    batches = list(iter_sdss_tiled(center_coord, total_radius_deg, failures=failures, **kwargs))
+    if batches:
+        table = vstack(batches) if len(batches) > 1 else batches[0]
+    else:
+        table = empty_field_table()
+    return _set_fetch_errors(table, failures)
+
+
+def radial_query_sql(ra, dec, radius_arcmin, photoobj_fields=DEFAULT_PHOTOOBJ_FIELDS):
+    """
+    SQL for a single server-side cone search of radius_arcmin around (ra, dec).
+    fGetNearbyObjAllEq (NEARBY_FUNCTION) takes its radius in arcminutes and returns
+    exact distances.
+    """
+    columns = ', '.join(f'p.{f}' for f in photoobj_fields)
+    return f"""
+    SELECT {columns}
+    FROM dbo.{NEARBY_FUNCTION}({ra:.8f}, {dec:.8f}, {radius_arcmin:.6f}) AS n
+    JOIN PhotoObjAll AS p ON p.objID = n.objID
+    """
+
+
+def sdss_sql_query(sql, service=None):
+    """
+    Default SQL executor: SDSS SkyServer via astroquery, or via service if given
+    (e.g. a query_cache.CachedService).
+    """
+    if service is None:
+        from astroquery.sdss import SDSS as service
+    return service.query_sql(sql)
+
+
+def query_sdss_radial(center_coord, total_radius_deg=20/60, sql_func=None,
+                      photoobj_fields=DEFAULT_PHOTOOBJ_FIELDS, store=None):
+    """
+    Query SDSS with one server-side radial query covering the whole field.
+
+    sql_func, if given, replaces SDSS.query_sql; fields covered by store are read
+    locally. Returns the same Table contract as query_sdss_tiled: photometric
+    objects within total_radius_deg of center_coord, with a failed query or a
+    response at the row limit listed in fetch_errors().
+    """
+    if _store_covers(store, center_coord, total_radius_deg):
+        return store.query_field(center_coord.ra.deg, center_coord.dec.deg, total_radius_deg)
+    sql_func = sql_func or sdss_sql_query
+    sql = radial_query_sql(center_coord.ra.deg, center_coord.dec.deg,
+                           total_radius_deg * 60.0, photoobj_fields)
+    errors = []
+    try:
+        result = sql_func(sql)
+    except Exception as e:
+        errors.append(f"Error querying field at RA={center_coord.ra.deg:.4f}, DEC={center_coord.dec.deg:.4f}: {e}")
+        print(errors[-1])
+        result = None
+
+    if result is not None and len(result) >= SDSS_MAX_ROWS:
+        errors.append(f"Field at RA={center_coord.ra.deg:.4f}, DEC={center_coord.dec.deg:.4f} returned "
+                      f"{len(result)} rows and may be truncated by the server row limit")
+        print(f"Warning: {errors[-1]}")
+    if result is not None and len(result) > 0:
+        table = clip_to_field(result, center_coord, total_radius_deg)
+    else:
+        table = empty_field_table()
+    return _set_fetch_errors(table, errors)
+
+
+def batched_radial_query_sql(centers, radius_arcmin, photoobj_fields=DEFAULT_PHOTOOBJ_FIELDS):
+    """
+    SQL for several cone searches in one request. centers is a sequence of
+    (ra, dec) pairs; each row comes back tagged with the index of its field.
+    """
+    columns = ', '.join(f'p.{f}' for f in photoobj_fields)
+    parts = [f"""
+    SELECT {i} AS field_idx, {columns}
+    FROM dbo.{NEARBY_FUNCTION}({ra:.8f}, {dec:.8f}, {radius_arcmin:.6f}) AS n
+    JOIN PhotoObjAll AS p ON p.objID = n.objID"""
+             for i, (ra, dec) in enumerate(centers)]
+    return '\n    UNION ALL'.join(parts) + '\n'
+
+
+def split_by_field(result, n_fields):
+    """
+    Split a field_idx-tagged result into n_fields Tables (without the tag column).
+    """
+    if result is None or len(result) == 0:
+        return [empty_field_table() for _ in range(n_fields)]
+    field_idx = np.asarray(result['field_idx'])
+    order = np.argsort(field_idx, kind='stable')
+    bounds = np.searchsorted(field_idx[order], np.arange(n_fields + 1))
+    result = result[order]
+    result.remove_column('field_idx')
+    return [result[bounds[j]:bounds[j + 1]] for j in range(n_fields)]
+
+
+def _fetch_batch(center_coords, total_radius_deg, sql_func, max_rows, photoobj_fields):
+    """
+    Fetch one batch of fields with a single query. Batches whose response hits
+    max_rows (and so may be truncated) or that fail outright are halved and retried;
+    a single field that still fails or reaches max_rows gets the problem in its
+    fetch_errors().
+
+    Returns (list of per-field Tables, number of rows transferred).
+    """
+    centers = [(c.ra.deg, c.dec.deg) for c in center_coords]
+    sql = batched_radial_query_sql(centers, total_radius_deg * 60.0, photoobj_fields)
+    try:
+        result = sql_func(sql)
+        error = None
+    except Exception as e:
+        result, error = None, e
+
+    n_rows = 0 if result is None else len(result)
+    if len(center_coords) > 1 and (error is not None or n_rows >= max_rows):
+        half = len(center_coords) // 2
+        first, rows_a = _fetch_batch(center_coords[:half], total_radius_deg, sql_func, max_rows, photoobj_fields)
+        second, rows_b = _fetch_batch(center_coords[half:], total_radius_deg, sql_func, max_rows, photoobj_fields)
+        return first + second, rows_a + rows_b
+
+    c = center_coords[0]
+    errors = []
+    if error is not None:
+        errors.append(f"Error querying field at RA={c.ra.deg:.4f}, DEC={c.dec.deg:.4f}: {error}")
+        print(errors[-1])
+    elif n_rows >= max_rows:
+        errors.append(f"Field at RA={c.ra.deg:.4f}, DEC={c.dec.deg:.4f} returned {n_rows} rows "
+                      f"and may be truncated by the server row limit")
+        print(f"Warning: {errors[-1]}")
+
+    tables = split_by_field(result, len(center_coords))
+    return [_set_fetch_errors(clip_to_field(t, c, total_radius_deg) if len(t) else t, errors)
+            for t, c in zip(tables, center_coords)], n_rows
+
+
+def iter_sdss_fields_batched(center_coords, total_radius_deg=20/60, batch_size=25,
+                             max_batch_size=200, max_rows=SDSS_MAX_ROWS, target_fill=0.5,
+                             sql_func=None, photoobj_fields=DEFAULT_PHOTOOBJ_FIELDS):
+    """
+    Yield one Table per field centre, fetching batch_size fields per SQL query.
+
+    After each batch the running mean of rows per field is used to resize the next
+    batch so its response fills about target_fill of max_rows (capped at
+    max_batch_size fields). Responses that reach max_rows are split and re-queried,
+    so results are never silently truncated.
+    """
+    sql_func = sql_func or sdss_sql_query
+    center_coords = list(center_coords)
+    rows_per_field = None
+    k = max(1, int(batch_size))
+    i = 0
+    while i < len(center_coords):
+        batch = center_coords[i:i + k]
+        tables, n_rows = _fetch_batch(batch, total_radius_deg, sql_func, max_rows, photoobj_fields)
+        observed = n_rows / len(batch)
+        rows_per_field = observed if rows_per_field is None else 0.5 * (rows_per_field + observed)
+        k = int(np.clip(target_fill * max_rows / max(rows_per_field, 1.0), 1, max_batch_size))
+        i += len(batch)
+        yield from tables
+
+
+FETCH_MODES = ('tiled', 'radial', 'batched')
+
+
+def query_sdss_field(center_coord, total_radius_deg=20/60, mode='tiled', store=None, **kwargs):
+    """
+    Fetch all photometric objects within total_radius_deg of center_coord using the
+    selected fetch mode ('tiled', 'radial' or 'batched'). Fields fully covered by
+    store (a galaxy_store.GalaxyStore) are read locally instead. Extra keyword
+    arguments are passed to the underlying query function.
+    """
+    if mode == 'tiled':
+        return query_sdss_tiled(center_coord, total_radius_deg=total_radius_deg, store=store, **kwargs)
+    elif mode == 'radial':
+        return query_sdss_radial(center_coord, total_radius_deg=total_radius_deg, store=store, **kwargs)
+    elif mode == 'batched':
+        return next(iter_sdss_fields([center_coord], total_radius_deg=total_radius_deg, mode=mode,
+                                     store=store, **kwargs))
+    raise ValueError(f"Unknown fetch mode {mode!r}; expected one of {FETCH_MODES}")
+
+
+def iter_sdss_fields(center_coords, total_radius_deg=20/60, mode='tiled', store=None, **kwargs):
+    """
+    Yield the photometric objects around each of center_coords, in order. In
+    'batched' mode many fields share one request; other modes query field by field.
+    Fields covered by store are read locally and never sent to SDSS.
+    """
+    if mode == 'batched':
+        center_coords = list(center_coords)
+        local = [_store_covers(store, c, total_radius_deg) for c in center_coords]
+        remote = iter_sdss_fields_batched([c for c, is_local in zip(center_coords, local) if not is_local],
+                                          total_radius_deg=total_radius_deg, **kwargs)
+        for center_coord, is_local in zip(center_coords, local):
+            if is_local:
+                yield store.query_field(center_coord.ra.deg, center_coord.dec.deg, total_radius_deg)
+            else:
+                yield next(remote)
+        return
+    for center_coord in center_coords:
+        yield query_sdss_field(center_coord, total_radius_deg=total_radius_deg, mode=mode, store=store, **kwargs)
@@ -0,0 +1,114 @@
+"""
+sky_index.py
+
+Spatial index for angular neighbour searches on the sky.
+
+Positions are stored as 3D unit vectors in a scipy cKDTree. The straight-line
+(chord) distance between unit vectors, 2 sin(theta / 2), is monotonic in the
+angular separation theta, so an angular radius search is an exact Euclidean ball
+search in the tree, with no RA wrap or pole special cases.
+
+SkyTree.count_within() counts neighbours around every centre for several radii in
+a single dual-tree traversal: the tree is walked once at the largest radius and
+each pair is binned by distance, so 5/10/20 arcmin apertures cost the same as one.
+
+exclusion_mask() marks every object within a radius of any entry of an exclusion
+catalog (e.g. known lenses) in one nearest-neighbour pass over a tree of the
+exclusion catalog, and reports which entry excluded each object.
+
+Usage:
+    tree = SkyTree(galaxies['ra'], galaxies['dec'])
+    counts = tree.count_within(ra, dec, radii_deg=[5/60, 10/60, 20/60])   # (N, 3)
+    keep, excluded_by = exclusion_mask(galaxies['ra'], galaxies['dec'], lens_ra, lens_dec, 5/60)
+
+Requires: scipy, numpy
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def radec_to_unit(ra, dec):
+    """(N, 3) unit vectors for RA/Dec in degrees."""
+    ra = np.radians(np.asarray(ra, dtype=float))
+    dec = np.radians(np.asarray(dec, dtype=float))
+    cos_dec = np.cos(dec)
+    return np.column_stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)])
+
+
+def chord_length(radius_deg):
+    """Unit-sphere chord length equivalent to an angular radius in degrees."""
+    return 2 * np.sin(np.radians(np.asarray(radius_deg, dtype=float)) / 2)
+
+
+class SkyTree:
+    """
+    KD-tree over sky positions (degrees) for batched angular radius queries.
+    """
+
+    def __init__(self, ra, dec):
+        self.xyz = radec_to_unit(ra, dec)
+        self.tree = cKDTree(self.xyz)
+
+    def __len__(self):
+        return len(self.xyz)
+
+    def count_within(self, ra, dec, radii_deg, chunk_size=50000):
+        """
+        Number of indexed points strictly within each radius of each centre.
+
+        radii_deg may be a scalar (returns shape (N,)) or a sequence of R radii
+        (returns shape (N, R), in the order given). Centres are processed in
+        chunks of chunk_size to bound the memory used by neighbour pairs.
+        """
+        scalar = np.ndim(radii_deg) == 0
+        radii = np.atleast_1d(np.asarray(radii_deg, dtype=float))
+        order = np.argsort(radii)
+        chords = chord_length(radii[order])
+        n_radii = len(radii)
+
+        centres = radec_to_unit(ra, dec).reshape(-1, 3)
+        counts = np.zeros((len(centres), n_radii), dtype=np.int64)
+        if len(self) == 0:
+            return counts[:, 0] if scalar else counts
+
+        for start in range(0, len(centres), chunk_size):
+            chunk = centres[start:start + chunk_size]
+            pairs = cKDTree(chunk).sparse_distance_matrix(self.tree, chords[-1], output_type='ndarray')
+            # Bin k holds pairs with chords[k-1] <= d < chords[k]; bin n_radii is beyond the largest radius
+            bins = np.searchsorted(chords, pairs['v'], side='right')
+            hist = np.bincount(pairs['i'] * (n_radii + 1) + bins, minlength=len(chunk) * (n_radii + 1))
+            cumulative = np.cumsum(hist.reshape(len(chunk), n_radii + 1)[:, :n_radii], axis=1)
+            counts[start:start + len(chunk), order] = cumulative
+
+        return counts[:, 0] if scalar else counts
+
+    def nearest_within(self, ra, dec, radius_deg):
+        """
+        Index of the nearest indexed point within radius_deg (inclusive) of each
+        position, or -1 if there is none, and its separation in degrees (inf if none).
+        """
+        xyz = radec_to_unit(ra, dec).reshape(-1, 3)
+        if len(self) == 0:
+            return np.full(len(xyz), -1, dtype=np.int64), np.full(len(xyz), np.inf)
+        chord = chord_length(radius_deg)
+        dist, idx = self.tree.query(xyz, k=1, distance_upper_bound=chord * (1 + 1e-12))
+        found = dist <= chord
+        sep_deg = np.where(found, np.degrees(2 * np.arcsin(np.minimum(dist, 2) / 2)), np.inf)
+        return np.where(found, idx, -1).astype(np.int64), sep_deg
+
+    def query_within(self, ra, dec, radius_deg):
+        """List of index arrays of the points within radius_deg of each centre."""
+        centres = radec_to_unit(ra, dec).reshape(-1, 3)
+        return [np.asarray(idx, dtype=np.int64)
+                for idx in self.tree.query_ball_point(centres, chord_length(radius_deg))]
+
+
+def exclusion_mask(ra, dec, exclude_ra, exclude_dec, radius_deg):
+    """
+    Mask of the positions lying further than radius_deg from every entry of the
+    exclusion catalog (True = keep), and for each position the index of the
+    nearest exclusion entry within the radius (-1 for kept positions).
+    """
+    excluded_by, _ = SkyTree(exclude_ra, exclude_dec).nearest_within(ra, dec, radius_deg)
+    return excluded_by < 0, excluded_by
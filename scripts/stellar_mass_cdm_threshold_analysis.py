@@ -3,17 +3,21 @@ Analyze stellar mass surface densities near strong gravitational lenses,
 comparing them against a Cold Dark Matter (CDM) mass surface density threshold.
 
 Inputs:
-  - CSV file containing lens stellar mass data with columns including:
+  - Parquet (see results_store.py) or CSV file containing lens stellar mass data with columns including:
       * 'mass_surface_density_Msun_per_Mpc2' (stellar surface density)
       * 'redshift' (optional, for filtering valid lenses)
+    Only these columns, and only rows with positive values, are read from Parquet inputs.
 
 Outputs:
   - Prints summary of fraction of lenses below CDM threshold for a range of stellar baryon fractions (f_star)
-  - Saves a CSV file 'results/lens_threshold_summary.csv' with threshold results for reproducibility
+  - Saves 'results/lens_threshold_summary.parquet' with threshold results for reproducibility
+    (and a CSV copy if EXPORT_CSV is set)
+  - Saves 'results/lens_threshold_sweep.parquet': lenses below threshold over the dense
+    f_star x CDM threshold x stellar-mass scale grid of SWEEP_* (see threshold_sweep.py)
 
 Usage:
-  - Update the INPUT_CSV path to your local data file or relative path
-  - Run the script in an environment with pandas and numpy installed
+  - Update the INPUT_PATH to your local data file or relative path
+  - Run the script in an environment with pandas, numpy and pyarrow installed
 
 Author: Michael Feldstein
 Date: 2025-07-26
@@ -23,23 +27,35 @@ import pandas as pd
 import numpy as np
 import os
 
+from results_store import SWEEP_SCHEMA, THRESHOLD_SCHEMA, read_results, result_columns, write_results
+from threshold_sweep import sweep_table, threshold_sweep
+
 # === CONFIG ===
-INPUT_CSV = 'results/lens_stellar_mass_data.csv'  # replace with your CSV relative path
-OUTPUT_CSV = 'results/lens_threshold_summary.csv'
+INPUT_PATH = 'results/1486combined_lens_stellar_mass_all_2025Jul.parquet'  # .parquet or .csv
+OUTPUT_PATH = 'results/lens_threshold_summary.parquet'
+EXPORT_CSV = None  # e.g. 'results/lens_threshold_summary.csv' to also write a CSV copy
 CDM_THRESHOLD = 1e8  # Msun/kpc^2
 
+# Sensitivity cube: every combination of f_star, CDM threshold (Msun/kpc^2) and a
+# scale factor applied to all stellar masses; set SWEEP_OUTPUT_PATH = None to skip it
+SWEEP_OUTPUT_PATH = 'results/lens_threshold_sweep.parquet'
+SWEEP_F_STAR = np.linspace(0.005, 0.30, 119)
+SWEEP_CDM_THRESHOLD = np.logspace(7.5, 8.5, 41)
+SWEEP_MASS_SCALE = np.linspace(0.25, 2.0, 15)
+
 # === LOAD DATA ===
-df = pd.read_csv(INPUT_CSV)
-print(f"Loaded {len(df)} lenses from {INPUT_CSV}")
+# Read only the needed columns; the validity cuts (positive surface density and, if
+# available, redshift) are pushed down to the reader
+columns = ['mass_surface_density_Msun_per_Mpc2']
+filters = [('mass_surface_density_Msun_per_Mpc2', '>', 0)]
+if 'redshift' in result_columns(INPUT_PATH):
+    columns.append('redshift')
+    filters.append(('redshift', '>', 0))
+df_filtered = read_results(INPUT_PATH, columns=columns, filters=filters)
+print(f"Loaded {columns} for {len(df_filtered)} lenses from {INPUT_PATH}")
 
 # Convert surface density from Msun/Mpc^2 to Msun/kpc^2 (1 Mpc^2 = 1,000,000 kpc^2)
-df['mass_surface_density_Msun_per_kpc2'] = df['mass_surface_density_Msun_per_Mpc2'] / 1e6
-
-# Optional filtering for valid positive surface density and redshift if available
-if 'redshift' in df.columns:
-    df_filtered = df[(df['mass_surface_density_Msun_per_kpc2'] > 0) & (df['redshift'] > 0)].copy()
-else:
-    df_filtered = df[df['mass_surface_density_Msun_per_kpc2'] > 0].copy()
+df_filtered['mass_surface_density_Msun_per_kpc2'] = df_filtered['mass_surface_density_Msun_per_Mpc2'] / 1e6
 
 total_lenses = len(df_filtered)
 print(f"Lenses with valid redshift and positive stellar surface density: {total_lenses}")
@@ -47,24 +63,32 @@ print(f"Lenses with valid redshift and positive stellar surface density: {total_
 # Stellar baryon fractions (f_star) to test
 f_star_values = np.arange(0.01, 0.21, 0.01)  # 0.01 to 0.20 step 0.01
 
-# Calculate how many lenses fall below the CDM threshold at each f_star
-results = []
-for f_star in f_star_values:
-    # Inferred total mass surface density = stellar surface density / f_star
-    inferred_total_mass = df_filtered['mass_surface_density_Msun_per_kpc2'] / f_star
-    below_threshold_count = (inferred_total_mass < CDM_THRESHOLD).sum()
-    percent_below = 100 * below_threshold_count / total_lenses
-    results.append({
-        'f_star': round(f_star, 3),
-        'lenses_below_threshold': below_threshold_count,
-        'percent_below_threshold': round(percent_below, 2)
-    })
-
-# Save results to CSV
+# Count lenses whose inferred total mass surface density (stellar surface density / f_star)
+# falls below the CDM threshold at each f_star: one sort, then a binary search per f_star
+sigma_kpc2 = df_filtered['mass_surface_density_Msun_per_kpc2'].to_numpy()
+below_threshold_counts = threshold_sweep(sigma_kpc2, f_star_values, CDM_THRESHOLD)
+results = [{
+    'f_star': round(f_star, 3),
+    'lenses_below_threshold': below_threshold_count,
+    'percent_below_threshold': round(100 * below_threshold_count / total_lenses, 2)
+} for f_star, below_threshold_count in zip(f_star_values, below_threshold_counts)]
+
+# Save results as typed Parquet (and optionally CSV)
 results_df = pd.DataFrame(results)
-os.makedirs('results', exist_ok=True)
-results_df.to_csv(OUTPUT_CSV, index=False)
-print(f"\nSaved threshold summary to {OUTPUT_CSV}")
+os.makedirs(os.path.dirname(OUTPUT_PATH) or '.', exist_ok=True)
+write_results(results_df, OUTPUT_PATH, THRESHOLD_SCHEMA)
+print(f"\nSaved threshold summary to {OUTPUT_PATH}")
+if EXPORT_CSV:
+    write_results(results_df, EXPORT_CSV)
+    print(f"Exported threshold summary to {EXPORT_CSV}")
+
+# Dense sensitivity cube over f_star, CDM threshold and stellar-mass scale
+if SWEEP_OUTPUT_PATH:
+    sweep_df = sweep_table(sigma_kpc2, SWEEP_F_STAR, SWEEP_CDM_THRESHOLD, SWEEP_MASS_SCALE)
+    write_results(sweep_df, SWEEP_OUTPUT_PATH, SWEEP_SCHEMA)
+    print(f"Saved {len(sweep_df)}-point threshold sweep "
+          f"({len(SWEEP_F_STAR)} f_star x {len(SWEEP_CDM_THRESHOLD)} thresholds x {len(SWEEP_MASS_SCALE)} mass scales) "
+          f"to {SWEEP_OUTPUT_PATH}")
 
 # Print summary table
 print("\nSummary of lenses below CDM threshold:")
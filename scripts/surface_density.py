@@ -0,0 +1,54 @@
+"""
+surface_density.py
+
+Stellar mass surface densities for whole arrays of lenses and apertures at once.
+
+Calling cosmo.angular_diameter_distance(z) once per lens on a scalar is dominated
+by astropy's per-call overhead. surface_mass_density_array() broadcasts masses,
+redshifts and aperture radii together, looks distances up in an interpolated
+distance table (see distance_tables.py), and propagates invalid (NaN or missing)
+redshifts as NaN through a boolean mask instead of Python branches.
+
+Usage:
+    from surface_density import surface_mass_density_array
+    # sigma[i, j]: lens i within aperture j
+    sigma = surface_mass_density_array(masses, redshifts[:, None], radii_arcmin[None, :])
+"""
+
+import numpy as np
+from astropy.cosmology import Planck18 as cosmo
+
+from distance_tables import distance_table
+
+ARCMIN_TO_RAD = np.pi / (180 * 60)
+
+
+def angular_diameter_distance_mpc(redshift, cosmology=cosmo):
+    """
+    Angular diameter distance in Mpc for an array of redshifts, NaN where the
+    redshift is not finite (or beyond the distance table).
+    """
+    return distance_table(cosmology).angular_diameter_distance(redshift)
+
+
+def surface_mass_density_array(total_mass, redshift, radius_arcmin=20, cosmology=cosmo):
+    """
+    Stellar mass surface density in Msun/Mpc^2 within radius_arcmin for arrays of
+    masses, redshifts and aperture radii (broadcast against each other).
+    Entries with a missing or NaN redshift are NaN.
+    """
+    mass = np.asarray(total_mass, dtype=float)
+    radius = np.asarray(radius_arcmin, dtype=float)
+    d_a = angular_diameter_distance_mpc(redshift, cosmology)
+    radius_mpc = radius * ARCMIN_TO_RAD * d_a
+    return mass / (np.pi * radius_mpc**2)
+
+
+def surface_mass_density(total_mass, redshift, radius_arcmin=20):
+    """
+    Calculate stellar mass surface density in Msun/Mpc^2 within given radius_arcmin
+    using angular diameter distance from redshift (Planck18 cosmology).
+    Returns np.nan if redshift is invalid.
+    """
+    z = np.nan if redshift is None else redshift
+    return float(surface_mass_density_array(total_mass, z, radius_arcmin))
@@ -0,0 +1,158 @@
+"""
+tile_planner.py
+
+Plans the cone-search tiles used to cover a circular lens field.
+
+The original square np.linspace grid places tiles at the corners of the bounding
+square (outside the search circle), double-covers the interior, and steps RA in
+raw degrees, so fields away from the equator are covered unevenly in true angle.
+plan_hex_tiles() instead uses hexagonal packing, the thinnest lattice covering of
+the plane by equal circles:
+
+- tile centres sit on a triangular lattice with spacing sqrt(3) * tile_radius in the
+  plane tangent to the field centre, so every point is covered at minimum overlap;
+- only tiles whose hexagonal lattice cell touches the search disc are kept, and a
+  handful of lattice offsets are tried to find the one needing fewest tiles;
+- tangent-plane offsets are converted to RA/Dec with astropy's spherical offsets,
+  which carries the cos(dec) correction the linspace grid ignores.
+
+Each plan reports its redundancy factor (total tile area / field area), the
+expected number of times an object is downloaded. redundancy_factor() gives the
+realised value, rows downloaded per unique object, for benchmarking.
+
+Usage:
+    python scripts/tile_planner.py     # compares square and hexagonal plans
+"""
+
+import numpy as np
+from astropy.coordinates import SkyCoord
+import astropy.units as u
+
+
+class TilePlan:
+    """
+    Tile centres covering a circular field, plus bookkeeping for benchmarking.
+
+    Attributes:
+        centers (SkyCoord): tile centres (array-valued).
+        tile_radius_deg (float): radius of every tile.
+        field_radius_deg (float): radius of the field being covered.
+        n_tiles (int): number of tiles.
+        area_redundancy (float): total tile area / field area.
+    """
+
+    def __init__(self, centers, tile_radius_deg, field_radius_deg):
+        self.centers = centers
+        self.tile_radius_deg = tile_radius_deg
+        self.field_radius_deg = field_radius_deg
+        self.n_tiles = len(centers)
+        self.area_redundancy = self.n_tiles * tile_radius_deg**2 / field_radius_deg**2
+
+    def __repr__(self):
+        return (f"TilePlan(n_tiles={self.n_tiles}, tile_radius={self.tile_radius_deg * 60:.2f} arcmin, "
+                f"field_radius={self.field_radius_deg * 60:.2f} arcmin, "
+                f"area_redundancy={self.area_redundancy:.2f})")
+
+
+def _hex_cell_distance(x, y, tile_radius):
+    """
+    Distance from the origin to the pointy-top hexagonal cell (circumradius
+    tile_radius) centred at each (x, y); zero where the origin lies inside.
+    """
+    angles = np.radians(30 + 60 * np.arange(7))
+    vx = x[:, None] + tile_radius * np.cos(angles)[None, :]
+    vy = y[:, None] + tile_radius * np.sin(angles)[None, :]
+    ax, ay, bx, by = vx[:, :-1], vy[:, :-1], vx[:, 1:], vy[:, 1:]
+
+    # Closest point on each edge segment to the origin
+    ex, ey = bx - ax, by - ay
+    t = np.clip(-(ax * ex + ay * ey) / (ex**2 + ey**2), 0, 1)
+    edge_dist = np.hypot(ax + t * ex, ay + t * ey).min(axis=1)
+
+    # Origin inside the (convex) cell if it is on the same side of every edge
+    cross = ex * (-ay) - ey * (-ax)
+    inside = np.all(cross >= 0, axis=1) | np.all(cross <= 0, axis=1)
+    return np.where(inside, 0.0, edge_dist)
+
+
+def hex_offsets(field_radius, tile_radius, n_shifts=4):
+    """
+    Tangent-plane (x, y) offsets of hexagonal-packing tile centres covering a disc
+    of field_radius, in the same units as the radii. The lattice is shifted over
+    an n_shifts x n_shifts grid within one cell and the shift needing the fewest
+    tiles is returned.
+    """
+    if field_radius <= tile_radius:
+        return np.zeros(1), np.zeros(1)
+
+    dx = np.sqrt(3) * tile_radius
+    dy = 1.5 * tile_radius
+    n_cols = int(np.ceil((field_radius + tile_radius) / dx)) + 1
+    n_rows = int(np.ceil((field_radius + tile_radius) / dy)) + 1
+    cols, rows = np.meshgrid(np.arange(-n_cols, n_cols + 1), np.arange(-n_rows, n_rows + 1))
+    base_x = (cols + 0.5 * (rows % 2)).ravel() * dx
+    base_y = rows.ravel() * dy
+
+    best = None
+    for sx in np.arange(n_shifts) / n_shifts:
+        for sy in np.arange(n_shifts) / n_shifts:
+            x = base_x + sx * dx
+            y = base_y + sy * 2 * dy
+            keep = _hex_cell_distance(x, y, tile_radius) < field_radius
+            if best is None or keep.sum() < best[0].size:
+                best = (x[keep], y[keep])
+    return best
+
+
+def plan_hex_tiles(center_coord, field_radius_deg=20/60, tile_radius_arcmin=3.0, n_shifts=4):
+    """
+    Hexagonal covering of the disc of field_radius_deg around center_coord by
+    tiles of tile_radius_arcmin. Returns a TilePlan.
+    """
+    tile_radius_deg = tile_radius_arcmin / 60.0
+    x, y = hex_offsets(field_radius_deg, tile_radius_deg, n_shifts=n_shifts)
+    centers = center_coord.spherical_offsets_by(x * u.deg, y * u.deg)
+    return TilePlan(SkyCoord(ra=np.atleast_1d(centers.ra.deg), dec=np.atleast_1d(centers.dec.deg), unit='deg'),
+                    tile_radius_deg, field_radius_deg)
+
+
+def plan_square_tiles(center_coord, field_radius_deg=20/60, tile_radius_arcmin=3.0):
+    """
+    The original square linspace grid (no cos(dec) correction), as a TilePlan for
+    comparison with plan_hex_tiles.
+    """
+    tile_radius_deg = tile_radius_arcmin / 60.0
+    n_tiles_side = int(np.ceil((2 * field_radius_deg) / tile_radius_deg))
+    offsets = np.linspace(-field_radius_deg, field_radius_deg, n_tiles_side)
+    ra_off, dec_off = np.meshgrid(offsets, offsets, indexing='ij')
+    centers = SkyCoord(ra=center_coord.ra.deg + ra_off.ravel(),
+                       dec=center_coord.dec.deg + dec_off.ravel(), unit='deg')
+    return TilePlan(centers, tile_radius_deg, field_radius_deg)
+
+
+def coverage_fraction(plan, center_coord, n_samples=20000, seed=0):
+    """
+    Monte Carlo fraction of the field disc covered by at least one tile of plan.
+    """
+    rng = np.random.default_rng(seed)
+    r = plan.field_radius_deg * np.sqrt(rng.uniform(0, 1, n_samples))
+    phi = rng.uniform(0, 2 * np.pi, n_samples)
+    samples = center_coord.spherical_offsets_by(r * np.cos(phi) * u.deg, r * np.sin(phi) * u.deg)
+    _, sep, _ = samples.match_to_catalog_sky(plan.centers)
+    return float(np.mean(sep.deg <= plan.tile_radius_deg))
+
+
+def redundancy_factor(n_rows_downloaded, n_unique_objects):
+    """
+    Realised redundancy: rows downloaded per unique object (1.0 means no waste).
+    """
+    return n_rows_downloaded / n_unique_objects if n_unique_objects else np.nan
+
+
+if __name__ == "__main__":
+    for dec in [0.0, 30.0, 60.0, 80.0]:
+        center = SkyCoord(ra=180.0, dec=dec, unit='deg')
+        for name, plan in [('square', plan_square_tiles(center)), ('hex', plan_hex_tiles(center))]:
+            print(f"DEC={dec:+5.1f} {name:>6}: {plan.n_tiles:4d} tiles, "
+                  f"area redundancy {plan.area_redundancy:5.2f}, "
+                  f"coverage {coverage_fraction(plan, center):.4f}")